@@ -0,0 +1,347 @@
+# e2e_bench.py
+"""
+Offline end-to-end benchmark. Starts the fake API + HLS origin from
+servers.py, then runs each scenario in a fresh interpreter (empty caches,
+own SQLite files and download dir, own peak RSS) against it, with
+tg_stub.StubClient in place of Telegram:
+
+  fetch     search + episode list + source resolve through fetcher (cold, then warm)
+  segments  native HLS engine to .ts (parallel segment fetch, no ffmpeg)
+  remux     downloader.remux_hls (ffmpeg pulls the stream itself)
+  single    handlers._download_episode, one episode after another
+  batch     handlers._process_queue for several chats at once
+
+Reports episodes/min, p50/p99 per-episode latency and peak RSS, and
+writes everything to a JSON file that --compare can diff against.
+
+    python bench/e2e_bench.py --chats 4 --episodes 6 --bandwidth 4000000
+    python bench/e2e_bench.py --compare bench/results/<earlier>.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+SCENARIOS  = ("fetch", "segments", "remux", "single", "batch")
+NEEDS_FFMPEG = {"remux", "single", "batch"}
+
+
+# ── measurements ────────────────────────────────────────────────────────────
+def _pct(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _summary(latencies: list, seconds: float, extra: dict | None = None) -> dict:
+    return {
+        "episodes":         len(latencies),
+        "seconds":          round(seconds, 3),
+        "episodes_per_min": round(len(latencies) * 60 / seconds, 2) if seconds else 0.0,
+        "p50_s":            round(_pct(latencies, 0.50), 3),
+        "p99_s":            round(_pct(latencies, 0.99), 3),
+        "peak_rss_mb":      round(_peak_rss_mb(), 1),
+        "ffmpeg_peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        **(extra or {}),
+    }
+
+
+# ── scenarios (run in the child process) ────────────────────────────────────
+async def _catalogue(fetcher, chats: int, episodes: int) -> list:
+    animes = (await fetcher.search_anime_async("bench"))[:chats]
+    out = []
+    for a in animes:
+        eps = await fetcher.fetch_episodes_async(a["id"])
+        out.append((a, eps[:episodes]))
+    return out
+
+
+async def scenario_fetch(args) -> dict:
+    import fetcher
+    started = time.monotonic()
+    cat = await _catalogue(fetcher, args.chats, args.episodes)
+    ids = [e["episodeId"] for _, eps in cat for e in eps]
+
+    async def timed(ep):
+        t = time.monotonic()
+        await fetcher.resolve_episode_async(ep)
+        return time.monotonic() - t
+
+    cold = await asyncio.gather(*(timed(ep) for ep in ids))
+    seconds = time.monotonic() - started
+    warm = await asyncio.gather(*(timed(ep) for ep in ids))
+    return _summary(list(cold), seconds, {"warm_p50_s": round(_pct(list(warm), 0.5), 6)})
+
+
+async def scenario_segments(args) -> dict:
+    import fetcher
+    import hls
+    cat = await _catalogue(fetcher, args.chats, args.episodes)
+    out_dir = os.environ["DOWNLOAD_DIR"]
+    latencies = []
+
+    async def chat(anime, eps):
+        for e in eps:
+            t = time.monotonic()
+            res = await fetcher.resolve_episode_async(e["episodeId"])
+            out = os.path.join(out_dir, anime["id"], f"{e['number']}.ts")
+            await hls.download(res["sources"][0]["url"], res["referer"], out, quality=args.quality)
+            latencies.append(time.monotonic() - t)
+            os.remove(out)
+
+    started = time.monotonic()
+    await asyncio.gather(*(chat(a, eps) for a, eps in cat))
+    return _summary(latencies, time.monotonic() - started)
+
+
+async def scenario_remux(args) -> dict:
+    import fetcher
+    import downloader
+    cat = await _catalogue(fetcher, 1, args.episodes)
+    out_dir = os.environ["DOWNLOAD_DIR"]
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    started = time.monotonic()
+    for anime, eps in cat:
+        for e in eps:
+            t = time.monotonic()
+            res = await fetcher.resolve_episode_async(e["episodeId"])
+            url = await downloader.media_playlist_url(res["sources"][0]["url"], res["referer"], args.quality)
+            out = os.path.join(out_dir, anime["id"], f"{e['number']}.mp4")
+            # the sync helper, as scripts use it
+            await loop.run_in_executor(None, downloader.remux_hls, url, res["referer"], out)
+            latencies.append(time.monotonic() - t)
+            os.remove(out)
+    return _summary(latencies, time.monotonic() - started)
+
+
+async def _bot(args):
+    import handlers
+    from state_store import store
+    from tg_stub import StubClient
+    client = StubClient(upload_bandwidth=args.upload_bandwidth, latency=args.tg_latency)
+    return handlers, store, client
+
+
+async def scenario_single(args) -> dict:
+    import fetcher
+    handlers, store, client = await _bot(args)
+    (anime, eps), = await _catalogue(fetcher, 1, args.episodes)
+    chat_id = 1
+    store.set(chat_id, "current_anime_name", anime["name"])
+    store.set(chat_id, "episodes_map", {e["episodeId"]: e["number"] for e in eps})
+
+    latencies = []
+    started = time.monotonic()
+    for e in eps:
+        t = time.monotonic()
+        await handlers._download_episode(client, chat_id, e["episodeId"])
+        latencies.append(time.monotonic() - t)
+    return _summary(latencies, time.monotonic() - started, {
+        "uploaded_mb": round(client.uploaded / 2**20, 1),
+        "delivered":   len(client.delivered),
+    })
+
+
+async def scenario_batch(args) -> dict:
+    import fetcher
+    handlers, store, client = await _bot(args)
+    cat = await _catalogue(fetcher, args.chats, args.episodes)
+    for chat_id, (anime, eps) in enumerate(cat, 1):
+        store.set(chat_id, "current_anime_name", anime["name"])
+        store.set(chat_id, "episodes_map", {e["episodeId"]: e["number"] for e in eps})
+        store.queue_extend(chat_id, [handlers._new_job(chat_id, e["episodeId"]) for e in eps])
+
+    started = time.monotonic()
+    await asyncio.gather(*(handlers._process_queue(client, chat_id)
+                           for chat_id in range(1, len(cat) + 1)))
+    seconds = time.monotonic() - started
+    # per episode: time from the start of the batch to its delivery
+    latencies = [t - started for _, _, t in client.delivered]
+    return _summary(latencies, seconds, {
+        "chats":       len(cat),
+        "uploaded_mb": round(client.uploaded / 2**20, 1),
+    })
+
+
+def child(name: str, args):
+    sys.path[:0] = [HERE, ROOT, os.path.join(ROOT, "hianime-api")]
+
+    async def run():
+        import http_client
+        try:
+            return await globals()[f"scenario_{name}"](args)
+        finally:
+            await http_client.close_client()
+
+    print(json.dumps(asyncio.run(run())))
+
+
+# ── driver ──────────────────────────────────────────────────────────────────
+def _origin_stats(base: str) -> dict:
+    with urllib.request.urlopen(f"{base}/__stats") as resp:
+        return json.load(resp)
+
+
+def _start_origin(args, segment_dir: str | None):
+    cmd = [sys.executable, os.path.join(HERE, "servers.py"),
+           "--animes", str(max(args.chats, 1) + 5), "--episodes", str(max(args.episodes, 1)),
+           "--segments", str(args.segments), "--segment-seconds", str(args.segment_seconds),
+           "--latency", str(args.latency), "--api-latency", str(args.api_latency),
+           "--bandwidth", str(args.bandwidth)]
+    if segment_dir:
+        cmd += ["--segment-dir", segment_dir]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    base = proc.stdout.readline().strip()
+    if not base:
+        proc.kill()
+        raise RuntimeError("origin failed to start")
+    return proc, base
+
+
+def _run_scenario(name: str, args, base: str) -> dict:
+    work = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    env  = {
+        **os.environ,
+        "ANIWATCH_API_BASE": f"{base}/api/v2/hianime",
+        "API_ID": os.getenv("API_ID", "1"), "API_HASH": os.getenv("API_HASH", "bench"),
+        "DOWNLOAD_DIR":  os.path.join(work, "downloads"),
+        "FILE_CACHE_DB": os.path.join(work, "file_cache.db"),
+        "STATE_DB":      os.path.join(work, "state.db"),
+        "CACHE_DB":      "",
+        "BATCH_API_BASE": "",
+        "METRICS_PORT":  "0",
+        # the stub client has no MTProto connections to parallelise over
+        "UPLOAD_CONNECTIONS": "1",
+        "HLS_VARIANT":   args.quality,
+    }
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name, *sys.argv[1:]]
+    before = _origin_stats(base)
+    try:
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=args.timeout)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    after = _origin_stats(base)
+    if proc.returncode != 0 or not proc.stdout.strip():
+        return {"error": (proc.stderr or "no output").strip().splitlines()[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["origin_requests"] = after["requests"] - before["requests"]
+    result["origin_mb"]       = round((after["bytes_sent"] - before["bytes_sent"]) / 2**20, 1)
+    return result
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _print(results: dict, previous: dict | None):
+    cols = ("episodes", "episodes_per_min", "p50_s", "p99_s", "peak_rss_mb", "origin_mb")
+    print(f"{'scenario':<10}" + "".join(f"{c:>18}" for c in cols))
+    for name, r in results["scenarios"].items():
+        if "error" in r or "skipped" in r:
+            print(f"{name:<10}  {r.get('error') or r.get('skipped')}")
+            continue
+        row = f"{name:<10}"
+        old = (previous or {}).get("scenarios", {}).get(name, {})
+        for c in cols:
+            cell = f"{r.get(c, 0):g}"
+            if isinstance(old.get(c), (int, float)) and old[c]:
+                cell += f" ({(r.get(c, 0) - old[c]) / old[c]:+.0%})"
+            row += f"{cell:>18}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--chats", type=int, default=4, help="concurrent chats / anime")
+    parser.add_argument("--episodes", type=int, default=4, help="episodes per chat")
+    parser.add_argument("--segments", type=int, default=30, help="segments per episode")
+    parser.add_argument("--segment-seconds", type=float, default=4.0)
+    parser.add_argument("--latency", type=float, default=0.02, help="origin latency per HLS request (s)")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="API latency per request (s)")
+    parser.add_argument("--bandwidth", type=int, default=0, help="origin bytes/s per connection")
+    parser.add_argument("--upload-bandwidth", type=int, default=0, help="stub Telegram upload bytes/s")
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="stub Telegram call latency (s)")
+    parser.add_argument("--quality", default="480")
+    parser.add_argument("--media", choices=("real", "synthetic"), default="real",
+                        help="real: ffmpeg-encoded segments; synthetic: filler (fetch/segments only)")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--out", help="result file (default bench/results/<time>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args)
+
+    wanted  = [s for s in args.scenarios.split(",") if s]
+    ffmpeg  = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+    results = {"meta": {
+        "time":     time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git":      _git_rev(),
+        "python":   platform.python_version(),
+        "platform": platform.platform(),
+        "args":     {k: v for k, v in vars(args).items() if k not in ("child", "compare", "out")},
+    }, "scenarios": {}}
+
+    segment_dir = None
+    if args.media == "real" and ffmpeg:
+        segment_dir = os.path.join(HERE, ".cache", f"seg-{args.segments}x{args.segment_seconds:g}")
+        print(f"Encoding test segments into {segment_dir} …", file=sys.stderr)
+        from servers import make_segments
+        make_segments(segment_dir, args.segments, args.segment_seconds, ffmpeg)
+
+    origin, base = _start_origin(args, segment_dir)
+    try:
+        for name in wanted:
+            if name not in SCENARIOS:
+                results["scenarios"][name] = {"error": "unknown scenario"}
+            elif name in NEEDS_FFMPEG and (not ffmpeg or args.media == "synthetic"):
+                results["scenarios"][name] = {"skipped": "needs ffmpeg and --media real"}
+            else:
+                print(f"Running {name} …", file=sys.stderr)
+                results["scenarios"][name] = _run_scenario(name, args, base)
+    finally:
+        origin.terminate()
+        origin.wait()
+
+    out = args.out or os.path.join(HERE, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    _print(results, previous)
+    print(f"Saved {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, HERE)
+    main()
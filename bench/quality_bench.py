@@ -0,0 +1,81 @@
+# quality_bench.py
+"""
+Bytes per episode for each quality setting, from the sample playlists in
+bench/samples/. Runs offline: variants are chosen with the same code the
+downloader uses, sizes are BANDWIDTH × duration.
+
+    python bench/quality_bench.py [--json results.json]
+"""
+import os
+import sys
+import json
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "hianime-api"))
+
+import hls  # noqa: E402
+
+SAMPLES = os.path.join(HERE, "samples")
+
+# (label, quality, max_bitrate, max_mb)
+SETTINGS = [
+    ("best",            "best",  0,         0),
+    ("1080",            "1080",  0,         0),
+    ("720",             "720",   0,         0),
+    ("480",             "480",   0,         0),
+    ("360",             "360",   0,         0),
+    ("worst",           "worst", 0,         0),
+    ("best <=3Mbit/s",  "best",  3_000_000, 0),
+    ("best <=1.5Mbit/s", "best", 1_500_000, 0),
+    ("best <=400MB",    "best",  0,         400),
+    ("best <=200MB",    "best",  0,         200),
+]
+
+
+def _read(name: str) -> str:
+    with open(os.path.join(SAMPLES, name)) as f:
+        return f.read()
+
+
+def run() -> list:
+    duration = hls.playlist_duration(_read("media_24min.m3u8"))
+    results  = []
+    for name in sorted(os.listdir(SAMPLES)):
+        if not name.startswith("master_"):
+            continue
+        variants = hls.parse_master(_read(name), "http://bench.local/")
+        best     = hls.estimate_bytes(hls.pick_variant(variants, "best"), duration)
+        for label, quality, max_bitrate, max_mb in SETTINGS:
+            v = hls.choose_variant(variants, quality, duration, max_bitrate, max_mb)
+            size = hls.estimate_bytes(v, duration)
+            results.append({
+                "playlist":   name,
+                "setting":    label,
+                "resolution": "x".join(map(str, v["resolution"] or ())) or "?",
+                "bandwidth":  v["bandwidth"],
+                "duration":   round(duration, 1),
+                "bytes":      size,
+                "vs_best":    round(size / best, 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = run()
+    print(f"{'playlist':<22}{'setting':<18}{'variant':>11}{'kbit/s':>9}{'MB/ep':>9}{'vs best':>9}")
+    for r in results:
+        print(f"{r['playlist']:<22}{r['setting']:<18}{r['resolution']:>11}"
+              f"{r['bandwidth'] // 1000:>9}{r['bytes'] / 2**20:>9.1f}{r['vs_best']:>9.0%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# servers.py
+"""
+Local stand-ins for the bot's network peers, for offline benchmarks.
+One asyncio HTTP/1.1 server plays both the aniwatch API (the routes
+under ANIWATCH_API_BASE) and the HLS origin behind it, with a fixed
+latency before every response and an optional per-connection bandwidth
+cap.
+
+    python bench/servers.py --port 8765 --latency 0.02 --bandwidth 8000000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from urllib.parse import urlsplit, parse_qs
+
+API_PREFIX = "/api/v2/hianime"
+CHUNK      = 64 * 1024
+
+# (height, bandwidth in bit/s) of the generated ladder
+LADDER = [(1080, 5_300_000), (720, 2_800_000), (480, 1_200_000), (360, 630_000)]
+
+
+def make_segments(out_dir: str, count: int, seconds: float, ffmpeg: str = "ffmpeg",
+                  bitrate: int = 1_200_000) -> list:
+    """
+    Encode a test pattern into `count` MPEG-TS segments of `seconds`
+    each with ffmpeg (once; reused if already there). Returns the paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f"seg-{i}.ts") for i in range(count)]
+    if all(os.path.exists(p) for p in paths):
+        return paths
+    total = count * seconds
+    subprocess.run([
+        ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=854x480:rate=24:duration={total}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={total}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-b:v", str(bitrate), "-g", "48",
+        "-c:a", "aac", "-b:a", "96k",
+        "-f", "segment", "-segment_time", str(seconds), "-reset_timestamps", "0",
+        os.path.join(out_dir, "seg-%d.ts"),
+    ], check=True)
+    return paths
+
+
+class Origin:
+    """
+    Serves a catalogue of `animes` anime with `episodes` episodes each.
+    Every episode is a master playlist over LADDER whose media playlists
+    have `segments` segments of `segment_seconds`. Segments are either
+    the files in `segment_files` (real media, same for every variant) or
+    generated filler sized to the variant's bandwidth.
+    """
+
+    def __init__(self, animes: int = 20, episodes: int = 24, segments: int = 30,
+                 segment_seconds: float = 4.0, latency: float = 0.02,
+                 api_latency: float = 0.05, bandwidth: int = 0,
+                 segment_files: list | None = None):
+        self.animes          = animes
+        self.episodes        = episodes
+        self.segments        = segments
+        self.segment_seconds = segment_seconds
+        self.latency         = latency
+        self.api_latency     = api_latency
+        self.bandwidth       = bandwidth
+        self.segment_files   = [open(p, "rb").read() for p in segment_files or ()]
+        self._filler         = {}
+        self.requests = self.bytes_sent = 0
+        self.base = ""
+
+    # ── catalogue ───────────────────────────────────────────────────────────
+    def _anime(self, i: int) -> dict:
+        return {
+            "id":       f"bench-anime-{i}",
+            "name":     f"Bench Anime {i}",
+            "jname":    f"Benchi Anime {i}",
+            "poster":   f"{self.base}/poster/{i}.jpg",
+            "type":     "TV",
+            "duration": "24m",
+            "episodes": {"sub": self.episodes, "dub": 0},
+        }
+
+    def search(self, q: str, page: int) -> dict:
+        words  = q.lower().split()
+        found  = [a for a in map(self._anime, range(self.animes))
+                  if all(w in a["name"].lower() for w in words)]
+        size   = 26
+        chunk  = found[(page - 1) * size:page * size]
+        return {"status": 200, "data": {
+            "animes": chunk, "currentPage": page,
+            "hasNextPage": page * size < len(found),
+            "totalPages": max(1, -(-len(found) // size)),
+        }}
+
+    def episodes_of(self, anime_id: str) -> dict:
+        return {"status": 200, "data": {"totalEpisodes": self.episodes, "episodes": [
+            {"number": n, "title": f"Episode {n}", "isFiller": False,
+             "episodeId": f"{anime_id}?ep={n}"}
+            for n in range(1, self.episodes + 1)
+        ]}}
+
+    def sources(self, episode_id: str) -> dict:
+        key = episode_id.replace("?ep=", "-")
+        return {"status": 200, "data": {
+            "headers": {"Referer": f"{self.base}/"},
+            "sources": [{"url": f"{self.base}/hls/{key}/master.m3u8", "type": "hls"}],
+            "tracks": [
+                {"file": f"{self.base}/subs/{key}/eng-2.vtt", "label": "English", "kind": "captions"},
+                {"file": f"{self.base}/subs/{key}/spa-3.vtt", "label": "Spanish", "kind": "captions"},
+                {"file": f"{self.base}/thumbs/{key}.vtt", "kind": "thumbnails"},
+            ],
+        }}
+
+    # ── HLS ─────────────────────────────────────────────────────────────────
+    def master(self) -> str:
+        lines = ["#EXTM3U"]
+        for height, bw in LADDER:
+            lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={height * 16 // 9}x{height}",
+                      f"{height}/index.m3u8"]
+        return "\n".join(lines) + "\n"
+
+    def media(self) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3",
+                 f"#EXT-X-TARGETDURATION:{int(self.segment_seconds + 0.999)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.segments):
+            lines += [f"#EXTINF:{self.segment_seconds:.3f},", f"seg-{i}.ts"]
+        return "\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n"
+
+    def segment(self, height: int, index: int) -> bytes:
+        if self.segment_files:
+            return self.segment_files[index % len(self.segment_files)]
+        bw   = dict(LADDER).get(height, LADDER[-1][1])
+        size = int(bw * self.segment_seconds / 8)
+        if size not in self._filler:
+            # 188-byte TS packets with a sync byte, so it looks like MPEG-TS
+            packet = b"\x47" + b"\xff" * 187
+            self._filler[size] = (packet * (size // 188 + 1))[:size]
+        return self._filler[size]
+
+    def subtitle(self, lang: str) -> bytes:
+        cues = "".join(
+            f"{i}\n00:{i // 60:02d}:{i % 60:02d}.000 --> 00:{i // 60:02d}:{i % 60:02d}.900\n"
+            f"[{lang}] line {i}\n\n" for i in range(300)
+        )
+        return ("WEBVTT\n\n" + cues).encode()
+
+    # ── routing ─────────────────────────────────────────────────────────────
+    def route(self, path: str, qs: dict):
+        """(status, content type, body, is_api) for a GET."""
+        one = lambda k, d="": qs.get(k, [d])[0]
+        if path == "/__stats":
+            body = {"requests": self.requests, "bytes_sent": self.bytes_sent}
+            return 200, "application/json", json.dumps(body).encode(), False
+        if path.startswith(API_PREFIX):
+            sub = path[len(API_PREFIX):]
+            if sub == "/search":
+                body = self.search(one("q"), int(one("page", "1") or 1))
+            elif sub.startswith("/anime/") and sub.endswith("/episodes"):
+                body = self.episodes_of(sub[len("/anime/"):-len("/episodes")])
+            elif sub == "/episode/sources":
+                body = self.sources(one("animeEpisodeId"))
+            else:
+                return 404, "application/json", b'{"status":404}', True
+            return 200, "application/json", json.dumps(body).encode(), True
+
+        parts = path.strip("/").split("/")
+        if parts[0] == "hls" and parts[-1] == "master.m3u8":
+            return 200, "application/vnd.apple.mpegurl", self.master().encode(), False
+        if parts[0] == "hls" and parts[-1] == "index.m3u8":
+            return 200, "application/vnd.apple.mpegurl", self.media().encode(), False
+        if parts[0] == "hls" and parts[-1].startswith("seg-"):
+            index = int(parts[-1][4:-3])
+            return 200, "video/mp2t", self.segment(int(parts[-2]), index), False
+        if parts[0] == "subs":
+            return 200, "text/vtt", self.subtitle(parts[-1].split("-")[0]), False
+        return 404, "text/plain", b"not found", False
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    return
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                if int(headers.get("content-length", 0) or 0):
+                    await reader.readexactly(int(headers["content-length"]))
+
+                method, target, _ = request.decode("latin-1").split(" ", 2)
+                url = urlsplit(target)
+                status, ctype, body, is_api = self.route(url.path, parse_qs(url.query))
+                if method != "GET":
+                    status, body = 405, b""
+                self.requests += 1
+
+                await asyncio.sleep(self.api_latency if is_api else self.latency)
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'ERR'}\r\n"
+                    f"Content-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode()
+                )
+                await self._send(writer, body)
+                self.bytes_sent += len(body)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, body: bytes):
+        if not self.bandwidth:
+            writer.write(body)
+            await writer.drain()
+            return
+        started = time.monotonic()
+        for off in range(0, len(body), CHUNK):
+            writer.write(body[off:off + CHUNK])
+            await writer.drain()
+            ahead = (off + CHUNK) / self.bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0):
+        server = await asyncio.start_server(self.handle, host, port)
+        port = server.sockets[0].getsockname()[1]
+        self.base = f"http://{host}:{port}"
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake aniwatch API + HLS origin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--animes", type=int, default=20)
+    parser.add_argument("--episodes", type=int, default=24)
+    parser.add_argument("--segments", type=int, default=30)
+    parser.add_argument("--segment-seconds", type=float, default=4.0)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before each HLS response")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds before each API response")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/s per connection (0 = unlimited)")
+    parser.add_argument("--segment-dir", help="serve real .ts segments from here")
+    args = parser.parse_args()
+
+    files = None
+    if args.segment_dir:
+        files = sorted(
+            (os.path.join(args.segment_dir, f) for f in os.listdir(args.segment_dir) if f.endswith(".ts")),
+            key=lambda p: int(os.path.basename(p)[4:-3])
+        )
+    origin = Origin(args.animes, args.episodes, args.segments, args.segment_seconds,
+                    args.latency, args.api_latency, args.bandwidth, files)
+
+    async def run():
+        server = await origin.serve(args.host, args.port)
+        # the benchmark driver reads the address from the first line
+        print(origin.base, flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# startup_bench.py
+"""
+Cold-start time of both entry points against the fake origin: the API
+service until /health answers, and the bot's `main.py --check` (config,
+imports and startup checks; everything but the Telegram login) until it
+exits. Each is restarted `--runs` times, as a supervisor would.
+
+Expect about 1.5-2s for each on a small 1-CPU VM, not less than a
+second. Most of it is interpreter startup plus imports that readiness
+needs anyway: telethon for the bot, fastapi/pydantic for the API, and
+httpx with its TLS context for both. Deferring them would only move the
+wait to the first request. The bot's phase breakdown from its last run
+is printed too, so a slower start shows where the time went.
+
+    python bench/startup_bench.py --runs 5 [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _api_once(env: dict, timeout: float) -> float:
+    port    = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "main.py"], cwd=os.path.join(ROOT, "hianime-api"),
+                            env={**env, "PORT": str(port)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"API exited with {proc.returncode}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.2)
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("API not healthy in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _bot_once(env: dict, timeout: float, phases: list) -> float:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "--check"], env=env,
+                          check=True, timeout=timeout, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    # 'ready in 0.84s (imports 0.80s, checks 0.04s)'
+    phases[:] = proc.stdout.strip().splitlines()[-1:]
+    return elapsed
+
+
+def _summary(times: list) -> dict:
+    return {"runs": len(times), "min": round(min(times), 3),
+            "p50": round(statistics.median(times), 3), "max": round(max(times), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time of the API service and the bot")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    origin = subprocess.Popen([sys.executable, os.path.join(HERE, "servers.py")],
+                              stdout=subprocess.PIPE, text=True)
+    base = origin.stdout.readline().strip()
+    work = os.path.join(HERE, ".cache", "startup")
+    env  = {
+        **os.environ,
+        "ANIWATCH_API_BASE": f"{base}/api/v2/hianime",
+        "API_ID": os.getenv("API_ID", "1"), "API_HASH": os.getenv("API_HASH", "bench"),
+        "DOWNLOAD_DIR":  os.path.join(work, "downloads"),
+        "FILE_CACHE_DB": os.path.join(work, "file_cache.db"),
+        "STATE_DB":      os.path.join(work, "state.db"),
+        "CACHE_DB":      "",
+        "METRICS_PORT":  "0",
+    }
+    phases = []
+    try:
+        results = {
+            "api": _summary([_api_once(env, args.timeout) for _ in range(args.runs)]),
+            "bot": _summary([_bot_once(env, args.timeout, phases) for _ in range(args.runs)]),
+        }
+    finally:
+        origin.terminate()
+        origin.wait()
+
+    for name, r in results.items():
+        print(f"{name:4} ready  min {r['min']:.3f}s  p50 {r['p50']:.3f}s  max {r['max']:.3f}s  ({r['runs']} runs)")
+    if phases:
+        print(f"bot  last run: {phases[0]}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
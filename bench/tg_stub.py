@@ -0,0 +1,90 @@
+# tg_stub.py
+"""
+Stand-in for the Telethon client as used by handlers.py: messages can be
+sent, edited and deleted, and send_file "uploads" a path by reading it
+at a configurable rate. Cached re-sends of an InputDocument are instant.
+"""
+import os
+import time
+import random
+import itertools
+import asyncio
+
+CHUNK = 512 * 1024
+
+
+class StubDocument:
+    def __init__(self, size: int):
+        self.id             = random.getrandbits(62)
+        self.access_hash    = random.getrandbits(62)
+        self.file_reference = os.urandom(16)
+        self.size           = size
+
+
+class StubMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, client, chat_id: int, text: str = "", document=None):
+        self.id       = next(self._ids)
+        self.client   = client
+        self.chat_id  = chat_id
+        self.text     = text
+        self.document = document
+
+    async def edit(self, text: str, **kwargs):
+        await asyncio.sleep(self.client.latency)
+        self.text = text
+        return self
+
+    async def delete(self):
+        await asyncio.sleep(self.client.latency)
+
+
+class StubClient:
+    """
+    Records what would have reached Telegram. `upload_bandwidth` is in
+    bytes/s (0 = as fast as the file can be read); every API call waits
+    `latency` seconds.
+    """
+
+    def __init__(self, upload_bandwidth: int = 0, latency: float = 0.02):
+        self.upload_bandwidth = upload_bandwidth
+        self.latency          = latency
+        self.messages  = 0
+        self.uploaded  = 0
+        self.resent    = 0
+        self.delivered = []   # (chat_id, caption, monotonic time) per video
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.messages += 1
+        return StubMessage(self, chat_id, text)
+
+    async def send_file(self, chat_id: int, file, progress_callback=None, caption=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        if not isinstance(file, str):
+            # re-send of a cached document
+            self.resent += 1
+            self._deliver(chat_id, file, caption)
+            return StubMessage(self, chat_id, caption or "", file)
+
+        size    = os.path.getsize(file)
+        started = time.monotonic()
+        sent    = 0
+        with open(file, "rb") as f:
+            while chunk := f.read(CHUNK):
+                sent += len(chunk)
+                if self.upload_bandwidth:
+                    ahead = sent / self.upload_bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+                if progress_callback:
+                    await progress_callback(sent, size)
+        self.uploaded += size
+        doc = StubDocument(size)
+        self._deliver(chat_id, file, caption)
+        return StubMessage(self, chat_id, caption or "", doc)
+
+    def _deliver(self, chat_id: int, file, caption):
+        if caption and caption.startswith("▶️"):
+            self.delivered.append((chat_id, caption, time.monotonic()))
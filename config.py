@@ -11,8 +11,14 @@ API_BASE = os.getenv(
     "http://localhost:4000/api/v2/hianime"
 )
 
+# Extra sessions that upload for the main one (comma-separated): bot
+# tokens and/or names of already logged-in session files
+UPLOAD_WORKERS = [w.strip() for w in os.getenv("UPLOAD_WORKERS", "").split(",") if w.strip()]
+# Channel the workers post into and the main session copies from
+# (id like -100123… or @username); empty = workers post into the chat
+UPLOAD_CHANNEL = os.getenv("UPLOAD_CHANNEL", "").strip()
+if UPLOAD_CHANNEL.lstrip("-").isdigit():
+    UPLOAD_CHANNEL = int(UPLOAD_CHANNEL)
+
 if not API_ID or not API_HASH:
     raise RuntimeError("API_ID and API_HASH must be set in .env")
-
-# In‐memory per‐chat state (episode queues, etc.)
-STATE = {}
@@ -0,0 +1,106 @@
+# file_cache.py
+import os
+import json
+import time
+import sqlite3
+import logging
+
+from telethon import types
+from telethon.errors import (
+    FileReferenceExpiredError,
+    FileReferenceInvalidError,
+    MediaEmptyError,
+)
+
+# Persistent index of already-uploaded episodes
+FILE_CACHE_DB = os.getenv("FILE_CACHE_DB", "./file_cache.db")
+
+# Errors that mean a stored reference can no longer be re-sent
+STALE_ERRORS = (FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError)
+
+
+class FileIdCache:
+    """
+    Maps (episodeId, server, category, quality) to the Telegram documents
+    we uploaded for it, so any chat can be answered by re-sending the
+    stored reference instead of downloading and uploading again.
+    """
+
+    def __init__(self, path: str = FILE_CACHE_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        # subs: JSON list of [id, access_hash, file_reference hex]
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " episode_id TEXT, server TEXT, category TEXT, quality TEXT,"
+            " video_id INTEGER, video_hash INTEGER, video_ref BLOB,"
+            " subs TEXT, created REAL,"
+            " PRIMARY KEY (episode_id, server, category, quality))"
+        )
+        self._db.commit()
+
+    def get(self, key: tuple) -> dict | None:
+        row = self._db.execute(
+            "SELECT video_id, video_hash, video_ref, subs"
+            " FROM uploads WHERE episode_id = ? AND server = ? AND category = ? AND quality = ?",
+            key
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "video":     types.InputDocument(row[0], row[1], row[2]),
+            "subtitles": [
+                types.InputDocument(i, h, bytes.fromhex(ref))
+                for i, h, ref in json.loads(row[3] or "[]")
+            ],
+        }
+
+    def put(self, key: tuple, video_msg, sub_msgs=()) -> bool:
+        """Remember the documents of a finished upload; False if there is none."""
+        video = getattr(video_msg, "document", None)
+        if video is None:
+            return False
+        subs = [
+            [d.id, d.access_hash, d.file_reference.hex()]
+            for d in (getattr(m, "document", None) for m in sub_msgs) if d
+        ]
+        self._db.execute(
+            "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key, video.id, video.access_hash, video.file_reference,
+             json.dumps(subs), time.time())
+        )
+        self._db.commit()
+        return True
+
+    def delete(self, key: tuple):
+        self._db.execute(
+            "DELETE FROM uploads WHERE episode_id = ? AND server = ? AND category = ? AND quality = ?",
+            key
+        )
+        self._db.commit()
+
+    async def send(self, client, chat_id: int, key: tuple, caption: str) -> bool:
+        """
+        Re-send a cached upload to chat_id. Returns False on a miss or if
+        the stored reference has gone stale (the entry is then dropped).
+        """
+        entry = self.get(key)
+        if entry is None:
+            return False
+        try:
+            await client.send_file(chat_id, entry["video"], caption=caption, parse_mode="markdown")
+        except STALE_ERRORS:
+            logging.info("Stale file reference for %s, re-uploading", key)
+            self.delete(key)
+            return False
+
+        for sub in entry["subtitles"]:
+            try:
+                await client.send_file(chat_id, sub, caption="📄 Subtitle")
+            except STALE_ERRORS:
+                logging.info("Stale subtitle reference for %s", key)
+        return True
+
+
+file_cache = FileIdCache()
@@ -1,16 +1,41 @@
 # handlers.py
 
 import os
+import time
+import zlib
 import logging
 import asyncio
 
-from telethon import events, Button
-from config import STATE
+from telethon import events, Button, types
+import cache
 import fetcher
 import downloader
-
-# Where all downloads go
-DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "./downloads")
+import ffmpeg
+import hls
+from scheduler import scheduler
+from file_cache import file_cache
+from state_store import store
+from storage import storage, DELETE_AFTER_UPLOAD, MB
+from search_index import inline_search, INLINE_CACHE_TIME
+from upload_pool import upload_pool
+from prefetch import prefetcher, PREFETCH_EPISODES
+import metrics
+import uploader
+
+# Batch pipeline buffers: episodes resolved ahead of the downloader, and
+# episode files allowed on disk (downloading or awaiting upload) per chat
+RESOLVE_AHEAD = int(os.getenv("RESOLVE_AHEAD", 2))
+UPLOAD_BUFFER = int(os.getenv("UPLOAD_BUFFER", 2))
+# Re-resolve a queued episode whose links are older than this (seconds)
+SOURCES_MAX_AGE = float(os.getenv("SOURCES_MAX_AGE", 600))
+# Episode keyboards: episodes per page and per row, range buttons shown
+EP_PAGE_SIZE     = int(os.getenv("EP_PAGE_SIZE", 50))
+EP_ROW_SIZE      = int(os.getenv("EP_ROW_SIZE", 5))
+EP_RANGE_BUTTONS = int(os.getenv("EP_RANGE_BUTTONS", 5))
+# Telegram user ids allowed to use /stats (comma-separated)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+# Anime per chat whose last delivered episode is remembered for prefetching
+LAST_EPISODE_MAX = int(os.getenv("LAST_EPISODE_MAX", 50))
 
 
 async def register_handlers(client):
@@ -23,9 +48,10 @@ async def register_handlers(client):
     async def search_handler(event):
         query   = event.pattern_match.group(1).strip()
         chat_id = event.chat_id
+        prefetcher.cancel(chat_id)
 
         try:
-            results = fetcher.search_anime(query)
+            results = await fetcher.search_anime_async(query)
         except Exception as e:
             logging.exception("Search failed")
             return await event.reply(f"❌ Search error: {e}")
@@ -33,32 +59,56 @@ async def register_handlers(client):
         if not results:
             return await event.reply("🔍 No results found.")
 
-        state = STATE.setdefault(chat_id, {})
         # store id→title for later
-        state.setdefault("anime_meta", {})
-        for a in results[:5]:
-            state["anime_meta"][a["id"]] = a["name"]
+        store.remember_anime(chat_id, results[:5])
 
         buttons = [
-            [Button.inline(a["name"], data=f"ANIME|{a['id']}".encode())]
+            [Button.inline(a["name"], data=f"ANIME|{_list_token(a['id'])}".encode())]
             for a in results[:5]
         ]
         await event.reply("🔍 Select an anime:", buttons=buttons)
 
 
+    # ── Inline mode: @bot <query> ───────────────────────────────────────────────
+    @client.on(events.InlineQuery)
+    async def inline_handler(event):
+        query = event.text.strip()
+        if len(query) < 2:
+            return await event.answer([], cache_time=INLINE_CACHE_TIME)
+        page = int(event.offset or 1)
+        try:
+            found = await inline_search.search(event.sender_id, query, page)
+        except asyncio.CancelledError:
+            return   # superseded by a newer keystroke
+        except Exception:
+            logging.exception("Inline search failed")
+            return await event.answer([], cache_time=0)
+
+        # picked results come back as callbacks without a chat: key them by user
+        store.remember_anime(event.sender_id, found["animes"])
+        results = [await _inline_result(event.builder, a) for a in found["animes"][:50]]
+        await event.answer(
+            results,
+            cache_time=INLINE_CACHE_TIME,
+            next_offset=str(page + 1) if found["has_next"] else None
+        )
+
+
     # ── Anime selected: fetch its episodes ────────────────────────────────────
     @client.on(events.CallbackQuery(data=lambda d: d and d.startswith(b"ANIME|")))
     async def on_select_anime(event):
+        token    = event.data.decode().split("|", 1)[1]
+        chat_id  = _chat_of(event)
+        anime_id = _anime_of(chat_id, token)
+        if anime_id is None:
+            return await event.answer("⚠️ This list is outdated, search again.", alert=True)
         await event.answer()
-        anime_id = event.data.decode().split("|", 1)[1]
-        chat_id  = event.chat_id
-        state    = STATE.setdefault(chat_id, {})
 
-        anime_name = state.get("anime_meta", {}).get(anime_id, anime_id)
-        state["current_anime_name"] = anime_name
+        anime_name = store.anime_name(chat_id, anime_id)
+        store.set(chat_id, "current_anime_name", anime_name)
 
         try:
-            eps = fetcher.fetch_episodes(anime_id)
+            eps = await fetcher.fetch_episodes_async(anime_id)
         except Exception:
             logging.exception("Failed to fetch episodes")
             return await event.edit(
@@ -69,150 +119,772 @@ async def register_handlers(client):
         if not eps:
             return await event.edit("⚠️ No episodes found.")
 
-        # queue and map episodeId→number
-        state["queue"] = [e["episodeId"] for e in eps]
-        state["episodes_map"] = {e["episodeId"]: e["number"] for e in eps}
+        # map episodeId→number (in list order) for naming and Download All;
+        # the list itself is kept so paging never refetches it
+        store.set(chat_id, "current_anime_id", anime_id)
+        store.set(chat_id, "episodes_map", {e["episodeId"]: e["number"] for e in eps})
+        store.set(chat_id, "episodes", [[e["episodeId"], e["number"], e.get("title") or ""] for e in eps])
 
-        buttons = [
-            [Button.inline(f"{e['number']}. {e.get('title','')}",
-                           data=f"EP|{e['episodeId']}".encode())]
-            for e in eps
-        ]
-        buttons.append([Button.inline("▶️ Download All", data=f"ALL|{anime_id}".encode())])
+        text, buttons = _episode_page(anime_id, anime_name, store.get(chat_id, "episodes"), 0)
+        await event.edit(text, buttons=buttons, parse_mode="markdown")
+        _prefetch(chat_id, anime_id)
 
-        await event.edit(
-            f"📺 Found {len(eps)} episodes of **{anime_name}**.\nPick one or Download All:",
-            buttons=buttons,
-            parse_mode="markdown"
+
+    # ── Episode list paging ───────────────────────────────────────────────────
+    @client.on(events.CallbackQuery(data=lambda d: d and d.startswith(b"PAGE|")))
+    async def on_page(event):
+        _, token, page = event.data.decode().split("|")
+        chat_id  = _chat_of(event)
+        anime_id = store.get(chat_id, "current_anime_id") or ""
+        episodes = store.get(chat_id, "episodes", [])
+        if _list_token(anime_id) != token or not episodes:
+            return await event.answer("⚠️ This list is outdated, search again.", alert=True)
+
+        await event.answer()
+        text, buttons = _episode_page(
+            anime_id, store.get(chat_id, "current_anime_name", anime_id), episodes, int(page)
         )
+        await event.edit(text, buttons=buttons, parse_mode="markdown")
+
+
+    @client.on(events.CallbackQuery(data=b"NOOP"))
+    async def on_noop(event):
+        await event.answer()
 
 
     # ── Single‐episode callback ─────────────────────────────────────────────────
     @client.on(events.CallbackQuery(data=lambda d: d and d.startswith(b"EP|")))
     async def on_single_episode(event):
+        chat_id = _chat_of(event)
+        _, token, index = event.data.decode().split("|")
+        episodes = store.get(chat_id, "episodes", [])
+        if _list_token(store.get(chat_id, "current_anime_id") or "") != token or int(index) >= len(episodes):
+            return await event.answer("⚠️ This list is outdated, search again.", alert=True)
         await event.answer()
-        episode_id = event.data.decode().split("|", 1)[1]
-        await _download_episode(
-            event.client,
-            event.chat_id,
+        episode_id = episodes[int(index)][0]
+        scheduler.submit(
+            _chat_of(event),
             episode_id,
-            ctx_event=event
+            lambda: _download_episode(
+                event.client,
+                _chat_of(event),
+                episode_id,
+                ctx_event=event
+            )
         )
 
 
-    # ── “Download All” callback ────────────────────────────────────────────────
-    @client.on(events.CallbackQuery(data=lambda d: d and d.startswith(b"ALL|")))
+    # ── “Download All” / “Download range” callbacks ───────────────────────────
+    @client.on(events.CallbackQuery(data=lambda d: d and d.startswith((b"ALL|", b"RANGE|"))))
     async def on_all(event):
         await event.answer()
-        chat_id = event.chat_id
-        queue   = STATE.get(chat_id, {}).get("queue", [])
-        if not queue:
+        chat_id = _chat_of(event)
+        kind, token, *bounds = event.data.decode().split("|")
+        if _list_token(store.get(chat_id, "current_anime_id") or "") != token:
             return await event.edit("⚠️ Nothing queued.")
+        # the queue resolves these itself
+        prefetcher.cancel(chat_id)
+
+        episodes = list(store.get(chat_id, "episodes_map", {}))
+        if bounds:
+            episodes = episodes[int(bounds[0]):int(bounds[1])]
+        if not episodes:
+            return await event.edit("⚠️ Nothing queued.")
+
+        store.queue_extend(chat_id, [_new_job(chat_id, ep) for ep in episodes])
+        what = "all episodes" if kind == "ALL" else f"{len(episodes)} episodes"
+        await event.edit(f"✅ Queued {what}. Starting downloads…")
+        _start_queue(event.client, chat_id)
+
+
+    # ── /queue: scheduler depth and running jobs ──────────────────────────────
+    @client.on(events.NewMessage(
+        incoming=True,
+        outgoing=True,
+        pattern=r'^/queue(?:@[\w_]+)?$'
+    ))
+    async def queue_handler(event):
+        stats = scheduler.stats()
+        mine  = stats["per_chat"].get(event.chat_id, {"queued": 0, "running": []})
+        lines = [
+            f"📊 Global: {stats['running']} running, {stats['queued']} queued",
+            f"💬 This chat: {len(mine['running'])} running, {mine['queued']} queued",
+        ]
+        lines += [f"  ▶️ {label} ({secs:.0f}s)" for label, secs in mine["running"]]
+        lines.append(f"📥 Left in this chat's queue: {store.queue_len(event.chat_id)}")
+        if ffmpeg.running:
+            lines.append(f"🎞 ffmpeg: {len(ffmpeg.running)}/{ffmpeg.FFMPEG_MAX_PROCS} running")
+        for snap in ffmpeg.running.values():
+            eta = f", ETA {snap['eta']:.0f}s" if snap.get("eta") else ""
+            lines.append(f"  {snap['label']}: {snap['throughput'] / 1e6:.1f} MB/s{eta}")
+        disk = storage.stats()
+        lines.append(
+            f"💾 Disk: {disk['disk_free'] / 2**30:.1f} GB free, "
+            f"{disk['episodes']} episodes + {disk['checkpoints']} partial kept ({disk['bytes'] / 2**30:.1f} GB)"
+        )
+        await event.reply("\n".join(lines))
+
+
+    # ── /cancel: stop this chat's downloads ───────────────────────────────────
+    @client.on(events.NewMessage(
+        incoming=True,
+        outgoing=True,
+        pattern=r'^/cancel(?:@[\w_]+)?$'
+    ))
+    async def cancel_handler(event):
+        chat_id = event.chat_id
+        prefetcher.cancel(chat_id)
+        queued  = store.queue_clear(chat_id)
+        drain   = _draining.pop(chat_id, None)
+        if drain is not None:
+            drain.cancel()
+        stopped = scheduler.cancel(chat_id)
+        if not (queued or stopped or drain):
+            return await event.reply("ℹ️ Nothing to cancel.")
+        await event.reply(f"🛑 Cancelled {max(queued, stopped)} episode(s).")
+
+
+    # ── /quality: per-chat variant preference ─────────────────────────────────
+    @client.on(events.NewMessage(
+        incoming=True,
+        outgoing=True,
+        pattern=r'^/quality(?:@[\w_]+)?(?:\s+(\S+))?$'
+    ))
+    async def quality_handler(event):
+        chat_id = event.chat_id
+        want    = (event.pattern_match.group(1) or "").lower()
+        if not want:
+            current = store.get(chat_id, "quality", hls.HLS_VARIANT)
+            return await event.reply(
+                f"🎚 Quality: **{current}**\nUse /quality best|worst|1080|720|480|360",
+                parse_mode="markdown"
+            )
+        if want not in ("best", "worst") and not want.rstrip("p").isdigit():
+            return await event.reply("⚠️ Use best, worst or a height like 720.")
+        store.set(chat_id, "quality", want.rstrip("p") if want[0].isdigit() else want)
+        await event.reply(f"✅ Quality set to **{want}**", parse_mode="markdown")
+
+
+    # ── /stats: timings and counters, admins only ─────────────────────────────
+    @client.on(events.NewMessage(
+        incoming=True,
+        outgoing=True,
+        pattern=r'^/stats(?:@[\w_]+)?$'
+    ))
+    async def stats_handler(event):
+        if event.sender_id not in ADMIN_IDS:
+            return
+        await event.reply(_stats_text(), parse_mode="markdown")
+
+
+    await metrics.start_server()
+
+    # resume queues left unfinished by a restart
+    for chat_id in store.queued_chats():
+        _start_queue(client, chat_id)
+
+
+
+def _chat_of(event) -> int:
+    """Chat to work in; callbacks on inline-mode messages have none, so use the user's."""
+    return event.chat_id or event.sender_id
+
+
+async def _inline_result(builder, anime: dict):
+    eps  = anime.get("episodes") or {}
+    info = " · ".join(str(x) for x in (
+        anime.get("type"),
+        f"{eps['sub']} eps" if eps.get("sub") else None,
+        anime.get("duration"),
+    ) if x)
+    thumb = None
+    if anime.get("poster"):
+        thumb = types.InputWebDocument(anime["poster"], 0, "image/jpeg", [])
+    return await builder.article(
+        anime["name"],
+        description=info or None,
+        id=anime["id"][:64],
+        thumb=thumb,
+        text=f"📺 **{anime['name']}**",
+        parse_mode="markdown",
+        buttons=[Button.inline("📺 Episodes", data=f"ANIME|{_list_token(anime['id'])}".encode())],
+    )
+
+
+def _list_token(anime_id: str) -> str:
+    """
+    Short stand-in for an anime id in callback data, which Telegram caps
+    at 64 bytes; handlers compare it with the chat's current anime to
+    spot buttons of an outdated list, or look it up in the remembered
+    search results.
+    """
+    return f"{zlib.crc32(anime_id.encode()):08x}"
+
+
+def _anime_of(chat_id: int, token: str):
+    """The remembered search result whose id `token` stands for, or None."""
+    for anime_id in store.get(chat_id, "anime_meta", {}):
+        if _list_token(anime_id) == token:
+            return anime_id
+    return None
+
+
+def _episode_page(anime_id: str, anime_name: str, episodes: list, page: int):
+    """
+    Text and keyboard for one page of an episode list ([id, number,
+    title] entries). Only this page's buttons are built: numbered
+    episode buttons, prev/next, range shortcuts to nearby pages and
+    Download range / Download All.
+    """
+    pages = max(1, -(-len(episodes) // EP_PAGE_SIZE))
+    page  = min(max(page, 0), pages - 1)
+    start = page * EP_PAGE_SIZE
+    chunk = episodes[start:start + EP_PAGE_SIZE]
+
+    def span(p):
+        lo = episodes[p * EP_PAGE_SIZE][1]
+        hi = episodes[min((p + 1) * EP_PAGE_SIZE, len(episodes)) - 1][1]
+        return f"{lo}–{hi}"
+
+    lines = [f"📺 **{anime_name}**: {len(episodes)} episodes"]
+    if pages > 1:
+        lines[0] += f", page {page + 1}/{pages} ({span(page)})"
+    lines += [f"{num}. {title[:40]}" if title else f"{num}." for _, num, title in chunk]
+    text = "\n".join(lines)[:4000]
+
+    token   = _list_token(anime_id)
+    buttons = [
+        [Button.inline(str(num), data=f"EP|{token}|{start + i + j}".encode())
+         for j, (_, num, _) in enumerate(chunk[i:i + EP_ROW_SIZE])]
+        for i in range(0, len(chunk), EP_ROW_SIZE)
+    ]
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(Button.inline("‹ Prev", data=f"PAGE|{token}|{page - 1}".encode()))
+        nav.append(Button.inline(f"{page + 1}/{pages}", data=b"NOOP"))
+        if page < pages - 1:
+            nav.append(Button.inline("Next ›", data=f"PAGE|{token}|{page + 1}".encode()))
+        buttons.append(nav)
+
+        first = min(max(page - EP_RANGE_BUTTONS // 2, 0), max(pages - EP_RANGE_BUTTONS, 0))
+        buttons.append([
+            Button.inline(f"• {span(p)}" if p == page else span(p),
+                          data=f"PAGE|{token}|{p}".encode())
+            for p in range(first, min(first + EP_RANGE_BUTTONS, pages))
+        ])
+        buttons.append([Button.inline(
+            f"⬇️ Download {span(page)}",
+            data=f"RANGE|{token}|{start}|{start + len(chunk)}".encode()
+        )])
+    buttons.append([Button.inline("▶️ Download All", data=f"ALL|{token}".encode())])
+    return text, buttons
+
+
+def _new_job(chat_id: int, episode_id: str) -> dict:
+    """
+    Snapshot everything an episode needs from chat state, so a job
+    keeps its names even if the chat moves on to another anime.
+    """
+    anime_name = store.get(chat_id, "current_anime_name", episode_id)
+    ep_num     = store.get(chat_id, "episodes_map", {}).get(episode_id, "")
+    safe_anime = "".join(c for c in anime_name if c.isalnum() or c in " _-").strip()
+    out_dir    = os.path.join(storage.root, safe_anime)
+    quality    = store.get(chat_id, "quality", hls.HLS_VARIANT)
+    # the quality is part of the name: each variant is its own file on disk
+    label      = f"{quality}p" if str(quality).isdigit() else quality
+    return {
+        "chat_id":    chat_id,
+        "episode_id": episode_id,
+        "anime_name": anime_name,
+        "ep_num":     ep_num,
+        "out_dir":    out_dir,
+        "out_mp4":    os.path.join(out_dir, f"{safe_anime} ep-{ep_num} [{label}].mp4"),
+        "anime_id":   store.get(chat_id, "current_anime_id"),
+        "sub_paths":  [],
+        "server":     "hd-1",
+        "category":   "sub",
+        "quality":    quality,
+    }
+
+
+def _prefetch(chat_id: int, anime_id: str):
+    """
+    Warm the episodes the chat is likely to pick next: those after the
+    last one it got of this anime, or the first ones. Episodes already
+    in the file-ID cache or already on disk are skipped.
+    """
+    episodes = list(store.get(chat_id, "episodes_map", {}))
+    last     = store.get(chat_id, "last_episode", {}).get(anime_id)
+    start    = episodes.index(last) + 1 if last in episodes else 0
+    jobs     = (_new_job(chat_id, ep) for ep in episodes[start:start + PREFETCH_EPISODES])
+    prefetcher.schedule(chat_id, [
+        j for j in jobs
+        if file_cache.get(_cache_key(j)) is None
+        and j["out_mp4"] not in storage.entries and not storage.busy(j["out_mp4"])
+    ])
+
+
+def _cache_key(job: dict) -> tuple:
+    return (job["episode_id"], job["server"], job["category"], job["quality"])
+
 
-        await event.edit("✅ Queued all episodes. Starting downloads…")
-        asyncio.create_task(_process_queue(event.client, chat_id))
+def _caption(job: dict) -> str:
+    return f"▶️ **{job['anime_name']}** ep-{job['ep_num']}"
 
 
+async def _send_cached(client, job: dict) -> bool:
+    """Answer from the file-ID cache; False on a miss or stale reference."""
+    with metrics.span("cached_send"):
+        hit = await file_cache.send(client, job["chat_id"], _cache_key(job), _caption(job))
+    metrics.inc("file_cache_total", result="hit" if hit else "miss")
+    return hit
+
+
+def _finish(job: dict, result: str):
+    """
+    Count one episode's outcome and its wall time since it was picked up,
+    and remember a delivered one as where the chat is in that anime.
+    """
+    metrics.inc("episodes_total", result=result)
+    if result in ("ok", "cached") and job.get("anime_id"):
+        last = store.get(job["chat_id"], "last_episode", {})
+        last.pop(job["anime_id"], None)
+        last[job["anime_id"]] = job["episode_id"]
+        store.set(job["chat_id"], "last_episode", dict(list(last.items())[-LAST_EPISODE_MAX:]))
+    if "started" in job:
+        metrics.observe("episode_seconds", time.monotonic() - job["started"], result=result)
+
+
+def _file_bytes(paths) -> int:
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+async def _resolve_job(job: dict, resolved: dict | None = None):
+    """
+    Stage 1: one upstream scrape gives sources, referer and tracks.
+    `resolved` may be passed in when it came from a batch lookup.
+    """
+    if resolved is None:
+        with metrics.span("resolve"):
+            resolved = await fetcher.resolve_episode_async(
+                job["episode_id"], job["server"], job["category"]
+            )
+    sources  = resolved["sources"]
+    if not sources:
+        raise RuntimeError(f"No sources for {job['episode_id']}")
+    job["m3u8"]    = sources[0].get("url") or sources[0].get("file")
+    job["referer"] = resolved["referer"]
+    job["tracks"]  = resolved["tracks"]
+    job["resolved_at"] = time.time()
+
+
+async def _fetch_job(job: dict):
+    """
+    Stage 2: fetch & remux HLS → MP4, with the preferred-language
+    subtitles (SUB_LANGS) downloading alongside the video, or muxed
+    into it as soft subs when MUX_SUBS is on. Disk space is reserved
+    first; the finished files stay pinned in storage until uploaded.
+    """
+    key = job["out_mp4"]
+    # another job for the same file downloads it first; this one then reuses it
+    async with storage.lock(key):
+        # finished earlier in this run and not evicted since
+        if (paths := storage.get(key)) is not None:
+            storage.pin(key)
+            job["sub_paths"] = [] if downloader.MUX_SUBS else paths[1:]
+            return
+        await _download_job(job)
+
+
+async def _download_job(job: dict):
+    """_fetch_job() for a file not on disk yet; runs under the file's storage lock."""
+    key = job["out_mp4"]
+    os.makedirs(job["out_dir"], exist_ok=True)
+    # take over anything the prefetcher already fetched for this file
+    await prefetcher.claim(key)
+    # batch-resolved links may have sat in the queue past their signature
+    if time.time() - job.get("resolved_at", 0) > SOURCES_MAX_AGE:
+        await _resolve_job(job)
+
+    async def fetch_subs():
+        with metrics.span("subtitle"):
+            paths = await downloader.download_subtitles(
+                job["tracks"], job["out_dir"], os.path.splitext(os.path.basename(key))[0]
+            )
+        metrics.inc("bytes_total", _file_bytes(paths), kind="subtitle")
+        return paths
+
+    subs  = asyncio.create_task(fetch_subs())
+    muxed = []
+
+    try:
+        if downloader.MUX_SUBS:
+            # subtitles are small: have them before the remux and mux them in
+            # as soft tracks, so the episode is a single upload
+            muxed = await subs
+        waited = time.perf_counter()
+        async with scheduler.download_slots, storage.reserve(_reserve_bytes()):
+            metrics.observe("stage_seconds", time.perf_counter() - waited, stage="slot_wait")
+            with metrics.span("remux"):
+                await downloader.download_hls(
+                    job["m3u8"], job["referer"], key,
+                    subtitles=muxed, quality=job["quality"]
+                )
+        metrics.inc("bytes_total", _file_bytes([key]), kind="video")
+    except BaseException:
+        subs.cancel()
+        storage.discard(key)
+        raise
+
+    if not downloader.MUX_SUBS:
+        job["sub_paths"] = await subs
+    storage.add(key, [key, *muxed, *job["sub_paths"]])
+
+
+def _reserve_bytes() -> int | None:
+    """Space to hold for one download: twice the size cap if one is set."""
+    return int(2 * hls.MAX_EPISODE_MB * MB) if hls.MAX_EPISODE_MB else None
+
+
+async def _upload_job(client, job: dict):
+    """
+    Stage 3: send the video, then its subtitles, and remember the
+    uploads in the file-ID cache. With DELETE_AFTER_UPLOAD the local
+    files go once the cache holds them; otherwise they stay for LRU
+    eviction.
+    """
+    chat_id  = job["chat_id"]
+    sub_msgs = []
+    cached   = False
+    try:
+        async with scheduler.upload_slots:
+            with metrics.span("upload"):
+                video_msg = await upload_pool.send_video(
+                    client,
+                    chat_id,
+                    job["out_mp4"],
+                    progress=uploader.Progress(
+                        job.get("status"), f"**{job['anime_name']}** ep-{job['ep_num']}"
+                    ),
+                    caption=_caption(job),
+                    parse_mode="markdown"
+                )
+
+                for sub_path in job["sub_paths"]:
+                    if os.path.exists(sub_path):
+                        sub_msgs.append(await client.send_file(
+                            chat_id,
+                            sub_path,
+                            caption="📄 Subtitle",
+                            file_name=os.path.basename(sub_path)
+                        ))
+
+        metrics.inc("bytes_total", _file_bytes([job["out_mp4"], *job["sub_paths"]]), kind="uploaded")
+        cached = file_cache.put(_cache_key(job), video_msg, sub_msgs)
+    finally:
+        storage.release(job["out_mp4"], delete=cached and DELETE_AFTER_UPLOAD)
+
 
 async def _download_episode(client, chat_id: int, episode_id: str, ctx_event=None):
     """
     Downloads one episode (video + subtitle), renames the MP4 to
-    "<Anime Title> ep-<No>.mp4", and sends both files.
-    Subtitle selection prioritizes: eng-2.vtt, en.vtt, eng.vtt, english.vtt
+    "<Anime Title> ep-<No> [<quality>].mp4", and sends both files.
     """
-    state      = STATE.get(chat_id, {})
-    anime_name = state.get("current_anime_name", episode_id)
-    ep_num     = state.get("episodes_map", {}).get(episode_id, "")
-    safe_anime = "".join(c for c in anime_name if c.isalnum() or c in " _-").strip()
+    job = _new_job(chat_id, episode_id)
+    job["started"] = time.monotonic()
 
-    # choose edit vs new message
-    if ctx_event:
+    # choose edit vs new message: editing an inline-mode message returns a
+    # bool, not a message the progress and cleanup below could use
+    if ctx_event and not ctx_event.via_inline:
         edit_fn = ctx_event.edit
     else:
         edit_fn = lambda txt, **k: client.send_message(chat_id, txt, **k)
 
-    status = await edit_fn(
-        f"⏳ Downloading **{anime_name}** ep-{ep_num}…",
+    status = job["status"] = await edit_fn(
+        f"⏳ Downloading **{job['anime_name']}** ep-{job['ep_num']}…",
         parse_mode="markdown"
     )
 
     try:
-        out_dir = os.path.join(DOWNLOAD_DIR, safe_anime)
-        os.makedirs(out_dir, exist_ok=True)
-
-        # 1) Fetch & remux HLS → MP4
-        sources, referer = fetcher.fetch_sources_and_referer(episode_id)
-        m3u8     = sources[0].get("url") or sources[0].get("file")
-        mp4_name = f"{safe_anime} ep-{ep_num}.mp4"
-        out_mp4  = os.path.join(out_dir, mp4_name)
-
-        await asyncio.get_event_loop().run_in_executor(
-            None,
-            downloader.remux_hls,
-            m3u8, referer, out_mp4
-        )
-
-        # 2) Pick subtitle by filename priority
-        tracks   = fetcher.fetch_tracks(episode_id)
-        sub_path = None
-
-        priority = ["eng-2.vtt", "en.vtt", "eng.vtt", "english.vtt"]
-        selected = None
-
-        for want in priority:
-            for tr in tracks:
-                url   = tr.get("file") or tr.get("url") or ""
-                fname = url.split("/")[-1].lower()
-                if fname == want:
-                    selected = tr
-                    break
-            if selected:
-                break
-
-        if selected:
-            try:
-                sub_path = downloader.download_subtitle(selected, out_dir, episode_id)
-            except Exception:
-                logging.exception("Subtitle download failed for %s", want)
-
-        # 3) Send video
-        await client.send_file(
-            chat_id,
-            out_mp4,
-            caption=f"▶️ **{anime_name}** ep-{ep_num}",
-            parse_mode="markdown"
-        )
+        if await _send_cached(client, job):
+            return _finish(job, "cached")
+        await _resolve_job(job)
+        await _fetch_job(job)
+        await _upload_job(client, job)
+        _finish(job, "ok")
 
-        # 4) Send subtitle only if it matches our priority list
-        if sub_path and os.path.exists(sub_path):
-            await client.send_file(
-                chat_id,
-                sub_path,
-                caption="📄 Subtitle",
-                file_name=os.path.basename(sub_path)
-            )
+    except asyncio.CancelledError:
+        _finish(job, "cancelled")
+        raise
 
     except Exception:
         logging.exception("Download error")
-        await client.send_message(
+        _finish(job, "error")
+        await _quietly(client.send_message(
             chat_id,
-            f"❌ Failed downloading **{anime_name}** ep-{ep_num}"
-        )
+            f"❌ Failed downloading **{job['anime_name']}** ep-{job['ep_num']}"
+        ))
 
     finally:
-        await status.delete()
+        if status is not None:
+            await _quietly(status.delete())
+
+
+# ── metrics ─────────────────────────────────────────────────────────────────
+@metrics.collector
+def _gauges():
+    """Queue depths, caches, ffmpeg and disk, sampled on every scrape."""
+    sched = scheduler.stats()
+    disk  = storage.stats()
+    out = [
+        ("queue_depth", {"queue": "scheduler_queued"},  sched["queued"]),
+        ("queue_depth", {"queue": "scheduler_running"}, sched["running"]),
+        ("queue_depth", {"queue": "persisted"},         store.queue_len()),
+        ("ffmpeg_processes", {}, len(ffmpeg.running)),
+        ("ffmpeg_process_limit", {}, ffmpeg.FFMPEG_MAX_PROCS),
+        ("disk_free_bytes", {}, disk["disk_free"]),
+        ("disk_kept_bytes", {}, disk["bytes"]),
+        ("disk_evictions", {}, disk["evictions"]),
+    ]
+    for name, c in cache.stats().items():
+        out += [("cache_hits",   {"cache": name}, c["hits"]),
+                ("cache_misses", {"cache": name}, c["misses"])]
+    inline = inline_search.cache.stats()
+    out += [("cache_hits",   {"cache": "inline"}, inline["hits"] + inline["prefix_hits"]),
+            ("cache_misses", {"cache": "inline"}, inline["misses"])]
+    return out
+
+
+def _stats_text() -> str:
+    lines = ["📈 **Stage timings** (count · avg · p50 · p95)"]
+    for stage, t in sorted(metrics.stage_summary().items()):
+        lines.append(f"  {stage}: {t['count']} · {t['avg']:.1f}s · {t['p50']:.1f}s · {t['p95']:.1f}s")
+
+    results = {r: metrics.counter("episodes_total", result=r)
+               for r in ("ok", "cached", "error", "cancelled")}
+    lines.append("🎬 Episodes: " + ", ".join(f"{n:g} {r}" for r, n in results.items()))
+    lines.append("📦 Bytes: " + ", ".join(
+        f"{kind} {metrics.counter('bytes_total', kind=kind) / 2**30:.2f} GB"
+        for kind in ("video", "subtitle", "uploaded")
+    ))
+
+    rates = {"file-id": (metrics.counter("file_cache_total", result="hit"),
+                         metrics.counter("file_cache_total", result="miss"))}
+    rates.update({name: (c["hits"], c["misses"]) for name, c in cache.stats().items()})
+    inline = inline_search.cache.stats()
+    rates["inline"] = (inline["hits"] + inline["prefix_hits"], inline["misses"])
+    lines.append("🎯 Hit rates: " + ", ".join(
+        f"{name} {h / (h + m):.0%}" if h + m else f"{name} –" for name, (h, m) in rates.items()
+    ))
+
+    sched = scheduler.stats()
+    lines.append(
+        f"📥 Queues: {sched['running']} running, {sched['queued']} scheduled, "
+        f"{store.queue_len()} persisted"
+    )
+    lines.append(f"🎞 ffmpeg: {len(ffmpeg.running)}/{ffmpeg.FFMPEG_MAX_PROCS}")
+    pre = prefetcher.stats()
+    lines.append(
+        f"🔮 Prefetch: {pre['episodes']} in flight for {pre['chats']} chats, {pre['warmed']} warmed; "
+        + ", ".join(f"{metrics.counter('prefetch_total', result=r):g} {r}"
+                    for r in ("resolved", "warmed", "error", "cancelled"))
+    )
+    for w in upload_pool.stats():
+        lines.append(
+            f"📤 {w['name']}: {w['active']} active, {w['uploads']} done "
+            f"({w['bytes'] / 2**30:.2f} GB), {w['failures']} failed"
+            + ("" if w["healthy"] else ", cooling down")
+        )
+    return "\n".join(lines)
+
+
+_draining = {}   # chat_id -> task draining its queue
+
+
+def _start_queue(client, chat_id: int):
+    """Start draining chat_id's queue unless a drain is already running."""
+    if chat_id in _draining:
+        return
+    task = asyncio.create_task(_process_queue(client, chat_id))
+    _draining[chat_id] = task
+
+    def done(t):
+        if _draining.get(chat_id) is not t:
+            return
+        del _draining[chat_id]
+        # rows queued after the resolve stage ran out of work were left for
+        # the next drain; start it, unless this one stopped on an error
+        if not t.cancelled() and t.result() and store.queue_len(chat_id):
+            _start_queue(client, chat_id)
+
+    task.add_done_callback(done)
 
 
 async def _process_queue(client, chat_id: int):
     """
-    Drain the STATE queue for this chat, one episode at a time.
+    Drain this chat's persisted queue as a three-stage pipeline:
+
+      resolve ──(RESOLVE_AHEAD)──▶ download ──(UPLOAD_BUFFER)──▶ upload
+
+    Resolving runs a few episodes ahead; downloads go through the global
+    scheduler (so chats share capacity fairly) while earlier episodes
+    upload. At most UPLOAD_BUFFER episode files sit on disk at once, and
+    uploads go out in episode order. Each queue entry is only removed
+    once its upload finished, so a restart resumes where it stopped.
+    Returns False if the pipeline stopped on an error.
     """
-    queue = STATE.get(chat_id, {}).get("queue", [])
-    while queue:
-        ep = queue.pop(0)
-        try:
-            await _download_episode(client, chat_id, ep)
-        except Exception:
-            logging.exception("Queued download failed")
-            await client.send_message(chat_id, f"❌ Error on ep-{ep}")
-    await client.send_message(chat_id, "✅ All downloads complete!")
+    resolved_q = asyncio.Queue(maxsize=RESOLVE_AHEAD)
+    upload_q   = asyncio.Queue()
+    disk_slots = asyncio.Semaphore(UPLOAD_BUFFER)
+    taken      = set()   # queue row ids this drain took
+    pending    = {}      # scheduler future -> job, until its upload is handled
+
+    async def resolve_stage():
+        # take up to RESOLVE_AHEAD jobs, resolve them as one streamed batch
+        # and hand them on in queue order as their results come in; the
+        # next window is only taken once these are handed on, so links do
+        # not sit resolved long enough to expire
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = []
+            while len(jobs) < max(RESOLVE_AHEAD, 1) and (job := store.queue_take(chat_id)) is not None:
+                taken.add(job["queue_id"])
+                job["started"] = time.monotonic()
+                job["cached"]  = file_cache.get(_cache_key(job)) is not None
+                if not job["cached"]:
+                    metrics.inc("file_cache_total", result="miss")
+                jobs.append(job)
+            if not jobs:
+                break
+
+            results = {}   # queue_id -> future of that job's resolve
+            groups  = {}   # (server, category) -> episode_id -> futures waiting on it
+            for job in jobs:
+                if not job["cached"]:
+                    fut = results[job["queue_id"]] = loop.create_future()
+                    groups.setdefault((job["server"], job["category"]), {}) \
+                          .setdefault(job["episode_id"], []).append(fut)
+
+            async def feed(waiting, server, category):
+                try:
+                    async for ep, resolved, err in fetcher.resolve_many_async(list(waiting), server, category):
+                        for fut in waiting.pop(ep, ()):
+                            if err is not None:
+                                fut.set_exception(err)
+                            else:
+                                fut.set_result(resolved)
+                    err = RuntimeError("No result from the batch resolve")
+                except Exception as e:
+                    err = e
+                # a failed batch fails its remaining jobs instead of leaving them waiting
+                for futs in waiting.values():
+                    for fut in futs:
+                        fut.set_exception(err)
+
+            feeders = [asyncio.create_task(feed(waiting, *key)) for key, waiting in groups.items()]
+            try:
+                for job in jobs:
+                    if not job["cached"]:
+                        try:
+                            with metrics.span("resolve"):
+                                resolved = await results[job["queue_id"]]
+                            await _resolve_job(job, resolved)
+                        except Exception as e:
+                            logging.exception("Resolve failed for %s", job["episode_id"])
+                            job["error"] = e
+                    await resolved_q.put(job)
+            finally:
+                for f in feeders:
+                    f.cancel()
+        await resolved_q.put(None)
+
+    async def submit(job):
+        job["status"] = await _quietly(client.send_message(
+            chat_id,
+            f"⏳ Downloading **{job['anime_name']}** ep-{job['ep_num']}…",
+            parse_mode="markdown"
+        ))
+        fut = scheduler.submit(chat_id, job["episode_id"], lambda job=job: _fetch_job(job))
+        pending[fut] = job
+        return fut
+
+    async def download_stage():
+        while (job := await resolved_q.get()) is not None:
+            if "error" in job:
+                await upload_q.put((job, None))
+                continue
+            # released by the upload stage once the files are sent; a cached
+            # episode holds one too, in case its file ID is stale and it has
+            # to be downloaded after all
+            await disk_slots.acquire()
+            job["disk_slot"] = True
+            fut = None if job["cached"] else await submit(job)
+            await upload_q.put((job, fut))
+        await upload_q.put(None)
+
+    async def upload_stage():
+        while (item := await upload_q.get()) is not None:
+            job, fut = item
+            try:
+                if job["cached"]:
+                    if await _send_cached(client, job):
+                        _finish(job, "cached")
+                        continue
+                    # stale file ID: download it like any other episode; the
+                    # scheduled job resolves it first
+                    job["cached"] = False
+                    fut = await submit(job)
+                if fut is not None:
+                    await asyncio.wait([fut])
+                    if fut.cancelled():
+                        _finish(job, "cancelled")
+                        continue
+                    if fut.exception() is None:
+                        await _upload_job(client, job)
+                        _finish(job, "ok")
+                        continue
+                _finish(job, "error")
+                await _quietly(client.send_message(chat_id, f"❌ Error on ep-{job['ep_num'] or job['episode_id']}"))
+            except Exception:
+                logging.exception("Upload failed for %s", job["episode_id"])
+                _finish(job, "error")
+                await _quietly(client.send_message(chat_id, f"❌ Error on ep-{job['ep_num'] or job['episode_id']}"))
+            finally:
+                store.queue_done(chat_id, job["queue_id"])
+                taken.discard(job["queue_id"])
+                if fut is not None:
+                    pending.pop(fut, None)
+                if job.get("disk_slot"):
+                    disk_slots.release()
+                if job.get("status"):
+                    await _quietly(job["status"].delete())
+
+    # if one stage dies the others would wait on it forever: stop them all,
+    # and hand unfinished jobs back so Download All or a restart resumes them
+    stages = [asyncio.create_task(stage()) for stage in (resolve_stage, download_stage, upload_stage)]
+    try:
+        await asyncio.gather(*stages)
+    except Exception:
+        logging.exception("Queue of chat %s stopped", chat_id)
+        return False
+    finally:
+        for t in stages:
+            t.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        for fut, job in pending.items():
+            if not fut.cancel() and not fut.cancelled() and fut.exception() is None:
+                # downloaded, but its upload will not happen
+                storage.release(job["out_mp4"])
+        store.queue_release(chat_id, taken)
+    await _quietly(client.send_message(chat_id, "✅ All downloads complete!"))
+    return True
+
+
+async def _quietly(coro):
+    """Await a Telegram call whose failure must not stop the queue; None on error."""
+    try:
+        return await coro
+    except Exception:
+        logging.exception("Telegram call failed")
+        return None
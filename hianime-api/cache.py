@@ -0,0 +1,144 @@
+# cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Per-kind TTLs (seconds) and bounds
+CACHE_SEARCH_TTL   = float(os.getenv("CACHE_SEARCH_TTL", 300))
+CACHE_EPISODES_TTL = float(os.getenv("CACHE_EPISODES_TTL", 3600))
+CACHE_SOURCES_TTL  = float(os.getenv("CACHE_SOURCES_TTL", 600))
+CACHE_MAX_ENTRIES  = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+# Optional SQLite file backing every cache; empty disables persistence
+CACHE_DB           = os.getenv("CACHE_DB", "")
+
+MISSING = object()
+
+
+class SqliteStore:
+    """
+    Tiny write-through backing store: one table, rows namespaced by
+    cache name, values stored as JSON with an absolute expiry.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT, key TEXT, value TEXT, expires REAL,"
+            " PRIMARY KEY (ns, key))"
+        )
+        self._db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        self._db.commit()
+
+    def get(self, ns: str, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM cache WHERE ns = ? AND key = ?", (ns, key)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return MISSING, 0
+        return json.loads(row[0]), row[1]
+
+    def set(self, ns: str, key: str, value, expires: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (ns, key, json.dumps(value), expires)
+            )
+            self._db.commit()
+
+    def delete(self, ns: str, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (ns, key))
+            self._db.commit()
+
+
+class TTLCache:
+    """
+    Bounded in-memory LRU with per-entry expiry, optionally backed by a
+    SqliteStore so a restart starts warm. Keys must be JSON-serialisable.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = CACHE_MAX_ENTRIES, store=None):
+        self.name    = name
+        self.ttl     = ttl
+        self.maxsize = maxsize
+        self.store   = store
+        self._data   = OrderedDict()   # key -> (expires, value)
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _k(key) -> str:
+        return key if isinstance(key, str) else json.dumps(key)
+
+    def get(self, key):
+        k   = self._k(key)
+        now = time.time()
+        entry = self._data.get(k)
+        if entry is not None:
+            if entry[0] > now:
+                self._data.move_to_end(k)
+                self.hits += 1
+                return entry[1]
+            del self._data[k]
+
+        if self.store is not None:
+            value, expires = self.store.get(self.name, k)
+            if value is not MISSING:
+                self._put(k, value, expires)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        k       = self._k(key)
+        expires = time.time() + ttl
+        self._put(k, value, expires)
+        if self.store is not None:
+            self.store.set(self.name, k, value, expires)
+
+    def delete(self, key):
+        k = self._k(key)
+        self._data.pop(k, None)
+        if self.store is not None:
+            self.store.delete(self.name, k)
+
+    def _put(self, k: str, value, expires: float):
+        self._data[k] = (expires, value)
+        self._data.move_to_end(k)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size":      len(self._data),
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "evictions": self.evictions,
+            "hit_rate":  round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_store = SqliteStore(CACHE_DB) if CACHE_DB else None
+
+search_cache   = TTLCache("search",   CACHE_SEARCH_TTL,   store=_store)
+episodes_cache = TTLCache("episodes", CACHE_EPISODES_TTL, store=_store)
+sources_cache  = TTLCache("sources",  CACHE_SOURCES_TTL,  store=_store)
+
+
+def stats() -> dict:
+    return {c.name: c.stats() for c in (search_cache, episodes_cache, sources_cache)}
@@ -6,3 +6,6 @@ load_dotenv()
 ANIWATCH_API_BASE = os.getenv("ANIWATCH_API_BASE")
 if not ANIWATCH_API_BASE:
     raise RuntimeError("ANIWATCH_API_BASE must be set in .env")
+
+# fetcher reads the upstream base under the same name as the bot's config
+API_BASE = ANIWATCH_API_BASE
@@ -1,25 +1,149 @@
 # downloader.py
-import subprocess, os, requests
+import subprocess, os, asyncio, logging
+
+import ffmpeg
+import hls
+import http_client
+
+# "native" (parallel, checkpointed segment fetch in hls.py; ffmpeg only
+# muxes locally) or "ffmpeg" (ffmpeg pulls the stream itself). The native
+# engine falls back to ffmpeg once its resume attempts are exhausted.
+HLS_ENGINE = os.getenv("HLS_ENGINE", "native").lower()
+# how many times the native engine resumes from its checkpoint
+HLS_RESUME_ATTEMPTS = int(os.getenv("HLS_RESUME_ATTEMPTS", 3))
+# mux subtitles into the MP4 as soft tracks instead of sending .vtt files
+MUX_SUBS = os.getenv("MUX_SUBS", "0").lower() in ("1", "true", "yes")
+# subtitle languages to fetch, in order of preference (matched against
+# the track label / lang, e.g. "English", and the file name, e.g. eng-2.vtt)
+SUB_LANGS = [l.strip().lower() for l in os.getenv("SUB_LANGS", "english").split(",") if l.strip()]
+
+# short codes seen in subtitle file names → language names used in labels
+_LANG_ALIASES = {"en": "english", "eng": "english", "es": "spanish", "spa": "spanish",
+                 "pt": "portuguese", "por": "portuguese", "fr": "french", "fre": "french",
+                 "de": "german", "ger": "german", "it": "italian", "ita": "italian",
+                 "ar": "arabic", "ara": "arabic", "ru": "russian", "rus": "russian"}
+
+def _remux_args(m3u8_url: str, referer: str | None, out_path: str, subtitles: list = ()) -> list:
+    args = ["-y"]
+    if referer:
+        args += ["-headers", f"Referer: {referer}\r\n"]
+    args += ["-i", m3u8_url]
+    if subtitles:
+        sub_in, sub_out = ffmpeg.subtitle_args(subtitles)
+        return args + sub_in + sub_out + [out_path]
+    return args + ["-c", "copy", out_path]
 
 def remux_hls(m3u8_url: str, referer: str | None, out_path: str):
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    cmd = ["ffmpeg", "-y"]
-    if referer:
-        cmd += ["-headers", f"Referer: {referer}\r\n"]
-    cmd += ["-i", m3u8_url, "-c", "copy", out_path]
-    subprocess.run(cmd, check=True)
+    subprocess.run([ffmpeg.FFMPEG_BIN, *_remux_args(m3u8_url, referer, out_path)], check=True)
+
+async def remux_hls_async(m3u8_url: str, referer: str | None, out_path: str, subtitles: list = ()):
+    """remux_hls under the ffmpeg supervisor (process cap, kill on cancel/stall)."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    await ffmpeg.run(
+        _remux_args(m3u8_url, referer, out_path, subtitles),
+        label=os.path.basename(out_path)
+    )
+
+async def media_playlist_url(m3u8_url: str, referer: str | None, quality: str | None = None) -> str:
+    """
+    URL of the variant playlist matching `quality`, so ffmpeg pulls that
+    stream instead of whatever it would pick from the master playlist.
+    """
+    headers = {"Referer": referer} if referer else {}
+    _, url = await hls.fetch_media_playlist(m3u8_url, headers, quality)
+    return url
+
+async def download_hls(m3u8_url: str, referer: str | None, out_path: str,
+                       engine: str | None = None, subtitles: list = (),
+                       quality: str | None = None):
+    """
+    Fetch an HLS stream to out_path with the configured engine, muxing
+    `subtitles` (local .vtt paths) in as soft mov_text tracks. `quality`
+    picks the variant ("best", "worst", "720", …; default HLS_VARIANT).
+    """
+    engine = engine or HLS_ENGINE
+    if engine == "native":
+        for attempt in range(1, HLS_RESUME_ATTEMPTS + 1):
+            try:
+                return await hls.download(m3u8_url, referer, out_path, subtitles, quality)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception(
+                    "Native HLS attempt %d/%d failed for %s",
+                    attempt, HLS_RESUME_ATTEMPTS, out_path
+                )
+        logging.warning("Native HLS engine gave up, falling back to ffmpeg")
+
+    try:
+        m3u8_url = await media_playlist_url(m3u8_url, referer, quality)
+    except Exception:
+        logging.exception("Variant selection failed, letting ffmpeg pick")
+    await remux_hls_async(m3u8_url, referer, out_path, subtitles)
+    if engine == "native":
+        # ffmpeg made the file: the native engine's checkpoint is of no further use
+        hls.clear_checkpoint(out_path)
+    return out_path
+
+def _track_lang(track: dict) -> str:
+    """Best-effort language name of a subtitle track."""
+    label = (track.get("label") or track.get("lang") or "").strip().lower()
+    if label:
+        return label.split()[0].split("-")[0]
+    url  = track.get("file") or track.get("url") or ""
+    stem = url.rsplit("/", 1)[-1].split(".")[0].split("-")[0].lower()
+    return _LANG_ALIASES.get(stem, stem)
+
+def select_tracks(tracks: list, langs: list | None = None) -> list:
+    """
+    One subtitle track per wanted language, in preference order.
+    Thumbnail sprite tracks are ignored.
+    """
+    langs  = SUB_LANGS if langs is None else langs
+    wanted = [_LANG_ALIASES.get(l, l) for l in langs]
+    picked = {}
+    for tr in tracks:
+        if tr.get("kind", "captions") not in ("captions", "subtitles"):
+            continue
+        lang = _track_lang(tr)
+        if lang in wanted and lang not in picked:
+            picked[lang] = tr
+    return [picked[l] for l in wanted if l in picked]
+
+async def download_subtitle_async(track: dict, out_dir: str, base_name: str) -> str:
+    """
+    track: { lang/label, file (URL) }
+    Streams to out_dir/{base_name}_{lang}.vtt over the shared pool.
+    """
+    lang = (track.get("label") or track.get("lang") or _track_lang(track) or "subtitle").split()[0]
+    path = os.path.join(out_dir, f"{base_name}_{lang}.vtt")
+    os.makedirs(out_dir, exist_ok=True)
+    await http_client.download_to(track.get("file") or track["url"], path)
+    return path
+
+async def download_subtitles(tracks: list, out_dir: str, base_name: str,
+                             langs: list | None = None) -> list:
+    """
+    Download the preferred-language tracks concurrently. Returns the
+    paths that succeeded, in preference order.
+    """
+    chosen  = select_tracks(tracks, langs)
+    results = await asyncio.gather(
+        *(download_subtitle_async(tr, out_dir, base_name) for tr in chosen),
+        return_exceptions=True
+    )
+    paths = []
+    for tr, res in zip(chosen, results):
+        if isinstance(res, BaseException):
+            logging.error("Subtitle download failed for %s: %r", tr.get("label"), res)
+        else:
+            paths.append(res)
+    return paths
 
 def download_subtitle(track: dict, out_dir: str, base_name: str) -> str:
     """
     track: { lang, file (URL) }
     Saves to out_dir/{base_name}_{lang}.vtt
     """
-    lang = track.get("label", track.get("lang", "subtitle")).split()[0]
-    fname = f"{base_name}_{lang}.vtt"
-    path = os.path.join(out_dir, fname)
-    os.makedirs(out_dir, exist_ok=True)
-    resp = requests.get(track["file"])
-    resp.raise_for_status()
-    with open(path, "wb") as f:
-        f.write(resp.content)
-    return path
+    return http_client.run_sync(download_subtitle_async(track, out_dir, base_name))
@@ -1,47 +1,211 @@
 # fetcher.py
-import requests
+import os
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+
 from config import API_BASE
+import cache
+import http_client
+from singleflight import SingleFlight
 
-def search_anime(query: str, page: int = 1):
+# hianime-api base serving /batch/resolve; empty = resolve one by one
+BATCH_API_BASE    = os.getenv("BATCH_API_BASE", "")
+# episodes resolved concurrently by resolve_many_async
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+# episode sources are the most expensive scrape: coalesce identical lookups
+_resolve_flight = SingleFlight()
+
+# query params CDNs use for the expiry of a signed playlist URL
+_EXPIRY_PARAMS = ("expires", "expire", "exp", "e")
+# don't hand out a signed URL this close to its expiry
+_EXPIRY_MARGIN = 60
+
+
+def _sources_ttl(resolved: dict) -> float:
+    """
+    Cache TTL for a resolved payload: the configured sources TTL, cut
+    short by the earliest expiry signed into any of the source URLs.
+    """
+    ttl = cache.CACHE_SOURCES_TTL
+    now = time.time()
+    for src in resolved.get("sources", []):
+        url = src.get("url") or src.get("file") or ""
+        qs  = parse_qs(urlsplit(url).query)
+        for name in _EXPIRY_PARAMS:
+            try:
+                exp = float(qs[name][0])
+            except (KeyError, ValueError):
+                continue
+            ttl = min(ttl, exp - now - _EXPIRY_MARGIN)
+    return ttl
+
+
+# ── async API (used by the bot's handlers) ─────────────────────────────────────
+
+async def search_page_async(query: str, page: int = 1) -> dict:
     """
     GET /api/v2/hianime/search?q={query}&page={page}
-    Returns data.animes: list of { id, name, poster, ... } :contentReference[oaicite:0]{index=0}
+    Returns {"animes": [{ id, name, jname, poster, ... }], "has_next": bool}
     """
-    resp = requests.get(f"{API_BASE}/search", params={"q": query, "page": page})
-    resp.raise_for_status()
-    return resp.json().get("data", {}).get("animes", [])
+    key = ["page", query.strip().lower(), page]
+    hit = cache.search_cache.get(key)
+    if hit is not cache.MISSING:
+        return hit
 
-def fetch_episodes(anime_id: str):
+    body = await http_client.get_json(f"{API_BASE}/search", params={"q": query, "page": page})
+    data   = body.get("data", {})
+    result = {"animes": data.get("animes", []), "has_next": bool(data.get("hasNextPage"))}
+    cache.search_cache.set(key, result)
+    return result
+
+async def search_anime_async(query: str, page: int = 1):
+    """
+    GET /api/v2/hianime/search?q={query}&page={page}
+    Returns data.animes: list of { id, name, poster, ... }
+    """
+    return (await search_page_async(query, page))["animes"]
+
+async def fetch_episodes_async(anime_id: str):
     """
     GET /api/v2/hianime/anime/{animeId}/episodes
-    Returns data.episodes: 
-      [ { number, title, episodeId, isFiller }, … ] :contentReference[oaicite:1]{index=1}
+    Returns data.episodes:
+      [ { number, title, episodeId, isFiller }, … ]
     """
-    resp = requests.get(f"{API_BASE}/anime/{anime_id}/episodes")
-    resp.raise_for_status()
-    return resp.json().get("data", {}).get("episodes", [])
+    hit = cache.episodes_cache.get(anime_id)
+    if hit is not cache.MISSING:
+        return hit
 
-def fetch_sources_and_referer(episode_id: str):
+    body = await http_client.get_json(f"{API_BASE}/anime/{anime_id}/episodes")
+    episodes = body.get("data", {}).get("episodes", [])
+    if episodes:
+        cache.episodes_cache.set(anime_id, episodes)
+    return episodes
+
+async def _fetch_episode_sources(episode_id: str, server: str, category: str) -> dict:
     """
     GET /api/v2/hianime/episode/sources?animeEpisodeId={episodeId}&server=hd-1&category=sub
-    Returns (sources, referer) :contentReference[oaicite:2]{index=2}
+    One scrape yields sources, the Referer header and the subtitle tracks.
     """
-    resp = requests.get(
+    body = await http_client.get_json(
         f"{API_BASE}/episode/sources",
-        params={"animeEpisodeId": episode_id, "server": "hd-1", "category": "sub"}
+        params={"animeEpisodeId": episode_id, "server": server, "category": category}
     )
-    resp.raise_for_status()
-    data = resp.json().get("data", {})
-    return data.get("sources", []), data.get("headers", {}).get("Referer")
+    data = body.get("data", {})
+    resolved = {
+        "sources": data.get("sources", []),
+        "referer": data.get("headers", {}).get("Referer"),
+        "tracks":  data.get("tracks", []),
+    }
+    if resolved["sources"]:
+        cache.sources_cache.set([episode_id, server, category], resolved, _sources_ttl(resolved))
+    return resolved
 
-def fetch_tracks(episode_id: str):
+async def resolve_episode_async(episode_id: str, server: str = "hd-1", category: str = "sub") -> dict:
     """
-    Pull the subtitles (“tracks”) from the same endpoint :contentReference[oaicite:3]{index=3}
+    Returns { sources, referer, tracks } for an episode from a single
+    upstream call. Served from cache while the signed URLs are still
+    fresh; concurrent callers for the same episode share one request.
     """
-    # reuse the same call so we don’t double-scrape
-    sources, referer = fetch_sources_and_referer(episode_id)
-    data = requests.get(
-        f"{API_BASE}/episode/sources",
-        params={"animeEpisodeId": episode_id, "server": "hd-1", "category": "sub"}
-    ).json().get("data", {})
-    return data.get("tracks", [])
+    key = (episode_id, server, category)
+    hit = cache.sources_cache.get(list(key))
+    if hit is not cache.MISSING:
+        return hit
+
+    return await _resolve_flight.do(
+        key, lambda: _fetch_episode_sources(episode_id, server, category)
+    )
+
+async def fetch_sources_and_referer_async(episode_id: str):
+    """
+    Returns (sources, referer)
+    """
+    res = await resolve_episode_async(episode_id)
+    return res["sources"], res["referer"]
+
+async def fetch_tracks_async(episode_id: str):
+    """
+    Pull the subtitles (“tracks”) from the same resolved payload
+    """
+    res = await resolve_episode_async(episode_id)
+    return res["tracks"]
+
+
+async def _resolve_many_remote(episode_ids: list, server: str, category: str):
+    """
+    POST {BATCH_API_BASE}/batch/resolve and yield its NDJSON lines as
+    they arrive, warming the sources cache with each result.
+    """
+    client = http_client.get_client()
+    async with client.stream(
+        "POST",
+        f"{BATCH_API_BASE}/batch/resolve",
+        json={"episodeIds": episode_ids, "server": server, "category": category},
+        timeout=http_client.HTTP_TIMEOUT * 3,
+    ) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            ep   = item.pop("episodeId")
+            if "error" in item:
+                yield ep, None, RuntimeError(item["error"])
+                continue
+            if item.get("sources"):
+                cache.sources_cache.set([ep, server, category], item, _sources_ttl(item))
+            yield ep, item, None
+
+async def resolve_many_async(episode_ids: list, server: str = "hd-1", category: str = "sub",
+                             remote: bool = True):
+    """
+    Resolve many episodes, yielding (episode_id, resolved, error) in
+    completion order so callers can start on the first while the rest
+    are still in flight. Uses the hianime-api batch route when
+    BATCH_API_BASE is set, else a local fan-out of BATCH_CONCURRENCY.
+    """
+    pending = list(dict.fromkeys(episode_ids))
+
+    if remote and BATCH_API_BASE:
+        try:
+            async for ep, resolved, err in _resolve_many_remote(pending, server, category):
+                if ep in pending:
+                    pending.remove(ep)
+                    yield ep, resolved, err
+        except Exception:
+            logging.exception("Batch resolve failed, resolving %d episodes locally", len(pending))
+        if not pending:
+            return
+
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(ep):
+        async with sem:
+            try:
+                return ep, await resolve_episode_async(ep, server, category), None
+            except Exception as e:
+                return ep, None, e
+
+    for done in asyncio.as_completed([one(ep) for ep in pending]):
+        yield await done
+
+
+# ── sync wrappers (for scripts / REPL use) ────────────────────────────────────
+
+def search_anime(query: str, page: int = 1):
+    return http_client.run_sync(search_anime_async(query, page))
+
+def fetch_episodes(anime_id: str):
+    return http_client.run_sync(fetch_episodes_async(anime_id))
+
+def resolve_episode(episode_id: str, server: str = "hd-1", category: str = "sub"):
+    return http_client.run_sync(resolve_episode_async(episode_id, server, category))
+
+def fetch_sources_and_referer(episode_id: str):
+    return http_client.run_sync(fetch_sources_and_referer_async(episode_id))
+
+def fetch_tracks(episode_id: str):
+    return http_client.run_sync(fetch_tracks_async(episode_id))
@@ -0,0 +1,146 @@
+# ffmpeg.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+FFMPEG_BIN           = os.getenv("FFMPEG_BIN", "ffmpeg")
+# Concurrent ffmpeg processes across the whole process
+FFMPEG_MAX_PROCS     = int(os.getenv("FFMPEG_MAX_PROCS", 3))
+# Kill ffmpeg if it reports no progress for this long (seconds)
+FFMPEG_STALL_TIMEOUT = float(os.getenv("FFMPEG_STALL_TIMEOUT", 120))
+# Hard cap on one ffmpeg run (seconds)
+FFMPEG_TIMEOUT       = float(os.getenv("FFMPEG_TIMEOUT", 4 * 3600))
+
+# pid -> latest progress snapshot, for status / metrics
+running = {}
+
+_slots = None
+
+
+class FFmpegError(RuntimeError):
+    def __init__(self, returncode, stderr: str):
+        super().__init__(f"ffmpeg exited with {returncode}: {stderr[-500:]}")
+        self.returncode = returncode
+        self.stderr     = stderr
+
+
+# language names (as used in subtitle labels / file names) → ISO 639-2
+_ISO639 = {"english": "eng", "spanish": "spa", "portuguese": "por", "french": "fre",
+           "german": "ger", "italian": "ita", "arabic": "ara", "russian": "rus",
+           "japanese": "jpn", "indonesian": "ind", "thai": "tha", "vietnamese": "vie"}
+
+
+def subtitle_args(subtitles: list, first_input: int = 1):
+    """
+    Extra (input_args, output_args) to mux WebVTT files into an MP4 as
+    soft mov_text tracks next to the first video/audio stream of input
+    0, without re-encoding. Subtitle files named `<base>_<Lang>.vtt`
+    get a language tag.
+    """
+    inputs, outputs = [], ["-map", "0:v:0", "-map", "0:a:0?"]
+    for i, path in enumerate(subtitles):
+        inputs  += ["-i", path]
+        outputs += ["-map", f"{first_input + i}:0"]
+    outputs += ["-c", "copy", "-c:s", "mov_text"]
+    for i, path in enumerate(subtitles):
+        lang = os.path.splitext(os.path.basename(path))[0].rsplit("_", 1)[-1].lower()
+        outputs += [f"-metadata:s:s:{i}", f"language={_ISO639.get(lang, 'und')}"]
+    return inputs, outputs
+
+
+def _sem() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(FFMPEG_MAX_PROCS)
+    return _slots
+
+
+def _num(value: str, cast=int):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+def _snapshot(fields: dict, started: float, duration: float | None) -> dict:
+    out_s = _num(fields.get("out_time_us")) / 1e6
+    size  = _num(fields.get("total_size"))
+    speed = _num(fields.get("speed", "").rstrip("x"), float)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    snap = {
+        "out_time":   out_s,
+        "bytes":      size,
+        "throughput": size / elapsed,
+        "speed":      speed,
+        "elapsed":    elapsed,
+        "eta":        None,
+    }
+    if duration and speed > 0:
+        snap["eta"] = max(duration - out_s, 0) / speed
+    return snap
+
+
+async def run(args: list, *, label: str = "", duration: float | None = None,
+              progress=None, stall_timeout: float = FFMPEG_STALL_TIMEOUT,
+              timeout: float = FFMPEG_TIMEOUT):
+    """
+    Run `ffmpeg <args>` under the global process cap, parsing its
+    `-progress` output. `progress(snapshot)` is called on every report
+    (out_time, bytes, throughput, speed, eta if `duration` is known).
+    The child is killed on cancellation, on `timeout`, or when it goes
+    `stall_timeout` seconds without reporting.
+    """
+    async with _sem():
+        proc = await asyncio.create_subprocess_exec(
+            FFMPEG_BIN, "-hide_banner", "-nostdin", "-nostats",
+            "-progress", "pipe:1", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        started = time.monotonic()
+        tail    = deque(maxlen=30)
+        running[proc.pid] = {"label": label, "elapsed": 0.0, "eta": None, "throughput": 0.0}
+
+        async def drain_stderr():
+            async for line in proc.stderr:
+                tail.append(line.decode(errors="replace").rstrip())
+
+        async def read_progress():
+            fields = {}
+            deadline = started + timeout
+            while True:
+                wait = min(stall_timeout, deadline - time.monotonic())
+                if wait <= 0:
+                    raise asyncio.TimeoutError("ffmpeg exceeded its time limit")
+                line = await asyncio.wait_for(proc.stdout.readline(), wait)
+                if not line:
+                    return
+                key, _, value = line.decode(errors="replace").strip().partition("=")
+                fields[key] = value
+                if key == "progress":
+                    snap = _snapshot(fields, started, duration)
+                    running[proc.pid] = {"label": label, **snap}
+                    if progress:
+                        progress(snap)
+                    if value == "end":
+                        return
+
+        stderr_task = asyncio.create_task(drain_stderr())
+        try:
+            await read_progress()
+            rc = await asyncio.wait_for(proc.wait(), stall_timeout)
+        except BaseException as e:
+            if proc.returncode is None:
+                logging.warning("Killing ffmpeg %s (%s): %r", proc.pid, label, e)
+                proc.kill()
+                await proc.wait()
+            stderr_task.cancel()
+            raise
+        finally:
+            running.pop(proc.pid, None)
+            await asyncio.gather(stderr_task, return_exceptions=True)
+
+        if rc != 0:
+            raise FFmpegError(rc, "\n".join(tail))
@@ -0,0 +1,343 @@
+# hls.py
+# Native HLS engine: parse the playlist, fetch every segment concurrently
+# over the shared connection pool, then mux locally.
+import os
+import re
+import json
+import shutil
+import asyncio
+import logging
+from urllib.parse import urljoin, urlsplit
+
+import ffmpeg
+import http_client
+
+HLS_WORKERS         = int(os.getenv("HLS_WORKERS", 8))
+HLS_SEGMENT_RETRIES = int(os.getenv("HLS_SEGMENT_RETRIES", 4))
+# Default variant choice: "best", "worst" or a target height ("720", "480p")
+HLS_VARIANT         = os.getenv("HLS_VARIANT", "best")
+# Optional caps (0 = none): peak variant bitrate in bit/s, episode size in MB
+MAX_BITRATE         = int(os.getenv("MAX_BITRATE", 0))
+MAX_EPISODE_MB      = float(os.getenv("MAX_EPISODE_MB", 0))
+
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^",]*)')
+_URI_RE  = re.compile(r'URI="[^"]*"')
+
+
+def parse_attrs(line: str) -> dict:
+    """ATTR=value pairs of an #EXT-X-… tag line."""
+    return {k: v.strip('"') for k, v in _ATTR_RE.findall(line.split(":", 1)[-1])}
+
+
+def is_master(text: str) -> bool:
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master(text: str, base_url: str) -> list[dict]:
+    """
+    Returns the variants of a master playlist:
+      [ { url, bandwidth, resolution: (w, h) | None, codecs }, … ]
+    """
+    variants = []
+    attrs = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            attrs = parse_attrs(line)
+        elif line and not line.startswith("#") and attrs is not None:
+            res = attrs.get("RESOLUTION", "")
+            w, _, h = res.partition("x")
+            variants.append({
+                "url":        urljoin(base_url, line),
+                "bandwidth":  int(attrs.get("BANDWIDTH", 0) or 0),
+                "resolution": (int(w), int(h)) if w.isdigit() and h.isdigit() else None,
+                "codecs":     attrs.get("CODECS", ""),
+            })
+            attrs = None
+    return variants
+
+
+def pick_variant(variants: list[dict], pref: str | None = None,
+                 max_bitrate: int | None = None) -> dict:
+    """
+    Choose a variant by preference: "best", "worst", or a target height
+    ("720" / "720p") meaning the tallest variant not above it (the
+    smallest one if all are taller). Variants above `max_bitrate` are
+    skipped unless nothing fits, in which case the lowest is used.
+    """
+    pref   = str(pref or HLS_VARIANT).lower().rstrip("p")
+    ranked = sorted(variants, key=lambda v: v["bandwidth"])
+    if max_bitrate:
+        ranked = [v for v in ranked if v["bandwidth"] <= max_bitrate] or ranked[:1]
+
+    if pref == "worst":
+        return ranked[0]
+    if pref.isdigit():
+        height = lambda v: (v["resolution"] or (0, 0))[1]
+        fits   = [v for v in ranked if height(v) <= int(pref)]
+        if fits:
+            top = max(height(v) for v in fits)
+            return [v for v in fits if height(v) == top][-1]
+        return ranked[0]
+    return ranked[-1]
+
+
+def choose_variant(variants: list[dict], pref: str | None = None, duration: float = 0,
+                   max_bitrate: int | None = None, max_mb: float | None = None) -> dict:
+    """
+    pick_variant() plus an episode size cap: with a known `duration`,
+    `max_mb` becomes an extra bitrate ceiling.
+    """
+    max_bitrate = MAX_BITRATE if max_bitrate is None else max_bitrate
+    max_mb      = MAX_EPISODE_MB if max_mb is None else max_mb
+    if max_mb and duration:
+        size_cap    = int(max_mb * 1024 * 1024 * 8 / duration)
+        max_bitrate = min(max_bitrate, size_cap) if max_bitrate else size_cap
+    return pick_variant(variants, pref, max_bitrate)
+
+
+def estimate_bytes(variant: dict, duration: float) -> int:
+    return int(variant["bandwidth"] * duration / 8)
+
+
+def localize(text: str, base_url: str):
+    """
+    Rewrite a media playlist to point at local files.
+    Returns (local_playlist_text, [(local_name, remote_url), …], plain)
+    where `plain` is False if segments are encrypted or fMP4.
+    """
+    out, files = [], []
+    plain = True
+    seg = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(("#EXT-X-KEY", "#EXT-X-MAP")) and 'URI="' in line:
+            attrs = parse_attrs(line)
+            if attrs.get("METHOD", "") == "NONE":
+                out.append(line)
+                continue
+            plain = False
+            name  = f"{'key' if line.startswith('#EXT-X-KEY') else 'init'}_{len(files):05d}.bin"
+            files.append((name, urljoin(base_url, attrs["URI"])))
+            line = _URI_RE.sub(f'URI="{name}"', line)
+        elif line and not line.startswith("#"):
+            name = f"seg_{seg:05d}.ts"
+            files.append((name, urljoin(base_url, line)))
+            line = name
+            seg += 1
+        out.append(line)
+    return "\n".join(out) + "\n", files, plain
+
+
+async def _get_text(url: str, headers: dict):
+    resp = await http_client.request("GET", url, headers=headers)
+    return resp.text, str(resp.url)
+
+
+async def fetch_media_playlist(m3u8_url: str, headers: dict, quality: str | None = None):
+    """
+    Fetch `m3u8_url`, descending into the variant chosen for `quality`
+    (and the bitrate / size caps) if it is a master playlist.
+    Returns (text, url) of the media playlist.
+    """
+    text, url = await _get_text(m3u8_url, headers)
+    if not is_master(text):
+        return text, url
+
+    variants = parse_master(text, url)
+    if not variants:
+        raise ValueError(f"Master playlist without variants: {m3u8_url}")
+    chosen = choose_variant(variants, quality)
+    text, url = await _get_text(chosen["url"], headers)
+
+    # variants share a duration: re-check the size cap now that it is known
+    if MAX_EPISODE_MB:
+        capped = choose_variant(variants, quality, playlist_duration(text))
+        if capped["url"] != chosen["url"]:
+            text, url = await _get_text(capped["url"], headers)
+    return text, url
+
+
+class Manifest:
+    """
+    Checkpoint of segments already on disk, kept next to the output as
+    `<out>.manifest`: a JSON header line identifying the stream, then one
+    `name<TAB>size` line appended per finished file. A crash loses at
+    most the segments that were in flight.
+    """
+
+    def __init__(self, path: str, stream_key: str, total: int):
+        self.path   = path
+        self.header = {"stream": stream_key, "files": total}
+        self.done   = {}
+
+    def load(self, work_dir: str) -> dict:
+        """Read a matching checkpoint; entries are kept only if the file on disk agrees."""
+        try:
+            with open(self.path) as f:
+                if json.loads(f.readline() or "{}") != self.header:
+                    return self.done
+                for line in f:
+                    name, _, size = line.rstrip("\n").partition("\t")
+                    if size.isdigit():
+                        self.done[name] = int(size)
+        except (OSError, ValueError):
+            return self.done
+        self.done = {
+            n: sz for n, sz in self.done.items()
+            if os.path.exists(os.path.join(work_dir, n))
+            and os.path.getsize(os.path.join(work_dir, n)) == sz
+        }
+        return self.done
+
+    def start(self):
+        """(Re)write the header plus whatever survived load()."""
+        with open(self.path, "w") as f:
+            f.write(json.dumps(self.header) + "\n")
+            for name, size in self.done.items():
+                f.write(f"{name}\t{size}\n")
+
+    def record(self, name: str, size: int):
+        self.done[name] = size
+        with open(self.path, "a") as f:
+            f.write(f"{name}\t{size}\n")
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def _fetch_all(files: list, work_dir: str, headers: dict, manifest: Manifest):
+    """Download every missing (name, url) into work_dir with a bounded worker pool."""
+    queue = asyncio.Queue()
+    for item in files:
+        if item[0] not in manifest.done:
+            queue.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                name, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            size = await http_client.download_to(
+                url, os.path.join(work_dir, name),
+                headers=headers, retries=HLS_SEGMENT_RETRIES
+            )
+            manifest.record(name, size)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(min(HLS_WORKERS, queue.qsize()))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+
+
+def _concat(names: list, work_dir: str, out_path: str):
+    """Append the segments, in playlist order, into one TS file."""
+    with open(out_path, "wb") as out:
+        for name in names:
+            with open(os.path.join(work_dir, name), "rb") as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+
+
+def playlist_duration(text: str) -> float:
+    """Sum of #EXTINF durations of a media playlist."""
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith("#EXTINF:"):
+            try:
+                total += float(line[8:].split(",", 1)[0])
+            except ValueError:
+                pass
+    return total
+
+
+async def _mux(playlist: str, out_path: str, duration: float, subtitles: list = ()):
+    """
+    Local `-c copy` mux of the downloaded playlist (no network), plus
+    any subtitle files as soft tracks.
+    """
+    sub_in, sub_out = ffmpeg.subtitle_args(subtitles) if subtitles else ([], ["-c", "copy"])
+    await ffmpeg.run(
+        [
+            "-y", "-loglevel", "error",
+            "-allowed_extensions", "ALL",
+            "-protocol_whitelist", "file,crypto",
+            "-i", playlist, *sub_in, *sub_out, out_path,
+        ],
+        label=os.path.basename(out_path),
+        duration=duration,
+    )
+
+
+async def warm(m3u8_url: str, referer: str | None, out_path: str, count: int,
+               quality: str | None = None) -> int:
+    """
+    Fetch the playlists and the first `count` files of a stream into the
+    same `<out>.parts/` checkpoint download() resumes from, so a later
+    download of `out_path` starts with them on disk. Returns how many
+    files are there.
+    """
+    headers = {"Referer": referer} if referer else {}
+    text, url = await fetch_media_playlist(m3u8_url, headers, quality)
+    _, files, _ = localize(text, url)
+
+    work_dir = out_path + ".parts"
+    os.makedirs(work_dir, exist_ok=True)
+    manifest = Manifest(out_path + ".manifest", urlsplit(url).path, len(files))
+    manifest.load(work_dir)
+    manifest.start()
+    await _fetch_all(files[:count], work_dir, headers, manifest)
+    return len(manifest.done)
+
+
+async def download(m3u8_url: str, referer: str | None, out_path: str,
+                   subtitles: list = (), quality: str | None = None) -> str:
+    """
+    Download an HLS stream to `out_path`. Segments are fetched in
+    parallel into `<out>.parts/`, checkpointed in `<out>.manifest`, then
+    either concatenated (plain TS to .ts output) or muxed by a local
+    ffmpeg. If anything fails the parts and manifest are left behind, so
+    the next call for the same output only fetches what is missing.
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    headers = {"Referer": referer} if referer else {}
+
+    text, url = await fetch_media_playlist(m3u8_url, headers, quality)
+    local, files, plain = localize(text, url)
+    if not files:
+        raise ValueError(f"Empty media playlist: {m3u8_url}")
+
+    work_dir = out_path + ".parts"
+    os.makedirs(work_dir, exist_ok=True)
+
+    # signed query strings change on every resolve; the path does not
+    manifest = Manifest(out_path + ".manifest", urlsplit(url).path, len(files))
+    if manifest.load(work_dir):
+        logging.info("Resuming %s: %d/%d files on disk", out_path, len(manifest.done), len(files))
+    manifest.start()
+
+    await _fetch_all(files, work_dir, headers, manifest)
+
+    loop = asyncio.get_running_loop()
+    if plain and out_path.endswith(".ts") and not subtitles:
+        await loop.run_in_executor(None, _concat, [n for n, _ in files], work_dir, out_path)
+    else:
+        playlist = os.path.join(work_dir, "local.m3u8")
+        with open(playlist, "w") as f:
+            f.write(local)
+        await _mux(playlist, out_path, playlist_duration(text), subtitles)
+
+    clear_checkpoint(out_path)
+    return out_path
+
+
+def clear_checkpoint(out_path: str):
+    """Delete the `<out>.parts/` segments and `<out>.manifest` of a download."""
+    shutil.rmtree(out_path + ".parts", ignore_errors=True)
+    Manifest(out_path + ".manifest", "", 0).remove()
@@ -0,0 +1,137 @@
+# http_client.py
+import os
+import random
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+
+# Tunables (all overridable from the environment)
+HTTP_TIMEOUT         = float(os.getenv("HTTP_TIMEOUT", 20))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 64))
+HTTP_KEEPALIVE       = int(os.getenv("HTTP_KEEPALIVE", 32))
+HTTP_PER_HOST_LIMIT  = int(os.getenv("HTTP_PER_HOST_LIMIT", 8))
+HTTP_RETRIES         = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF         = float(os.getenv("HTTP_BACKOFF", 0.5))
+
+# Status codes worth another attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# One pool per event loop, so sync wrappers (which spin up their own
+# loop) never clobber the bot's long-lived client.
+_pools = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient for the running loop: one keep-alive
+    pool for every upstream.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool[0].is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_KEEPALIVE,
+            ),
+            follow_redirects=True,
+        )
+        pool = _pools[loop] = (client, {})
+    return pool[0]
+
+
+async def close_client():
+    """Close the running loop's pool (call on shutdown)."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None and not pool[0].is_closed:
+        await pool[0].aclose()
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    limits = _pools[asyncio.get_running_loop()][1]
+    host   = urlsplit(url).netloc
+    sem    = limits.get(host)
+    if sem is None:
+        sem = limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+    return sem
+
+
+async def request(method: str, url: str, *, retries: int | None = None, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared pool, bounded per host, retrying
+    transport errors and 429/5xx with exponential backoff + jitter.
+    Raises httpx.HTTPStatusError on a final non-2xx answer.
+    """
+    client   = get_client()
+    attempts = (HTTP_RETRIES if retries is None else retries) + 1
+
+    for attempt in range(attempts):
+        try:
+            async with _host_limit(url):
+                resp = await client.request(method, url, **kwargs)
+            if resp.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                resp.raise_for_status()
+                return resp
+            logging.warning("HTTP %s from %s, retrying", resp.status_code, url)
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+            logging.warning("Transport error on %s, retrying", url, exc_info=True)
+
+        await asyncio.sleep(HTTP_BACKOFF * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF))
+
+
+async def download_to(url: str, path: str, *, retries: int | None = None,
+                      chunk_size: int = 1 << 16, **kwargs) -> int:
+    """
+    Stream a GET response straight to `path` (via a .part file renamed
+    on success) with the same retry policy as request(). Returns the
+    number of bytes written.
+    """
+    client   = get_client()
+    attempts = (HTTP_RETRIES if retries is None else retries) + 1
+    tmp      = path + ".part"
+
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            async with _host_limit(url):
+                async with client.stream("GET", url, **kwargs) as resp:
+                    if resp.status_code not in RETRY_STATUSES or last:
+                        resp.raise_for_status()
+                        size = 0
+                        with open(tmp, "wb") as f:
+                            async for chunk in resp.aiter_bytes(chunk_size):
+                                f.write(chunk)
+                                size += len(chunk)
+                        os.replace(tmp, path)
+                        return size
+            logging.warning("HTTP %s from %s, retrying", resp.status_code, url)
+        except httpx.TransportError:
+            if last:
+                raise
+            logging.warning("Transport error on %s, retrying", url, exc_info=True)
+
+        await asyncio.sleep(HTTP_BACKOFF * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF))
+
+
+async def get_json(url: str, params: dict | None = None, **kwargs):
+    resp = await request("GET", url, params=params, **kwargs)
+    return resp.json()
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code, closing the
+    pool it opened so nothing leaks past the temporary loop.
+    """
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            await close_client()
+    return asyncio.run(_runner())
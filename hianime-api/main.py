@@ -1,19 +1,59 @@
 # hianime-api/main.py
+import time
+_STARTED = time.perf_counter()
 
 import os
+import logging
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+import cache
+import fetcher
+import http_client
+import preflight
+from config import API_BASE
+from response_cache import ResponseStore, ResponseCacheMiddleware
+
+preflight.timings["imports"] = time.perf_counter() - _STARTED
+
+# Upper bound on one route's upstream work, retries included
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 30))
+
+# Server-side response cache TTLs (seconds) per route
+ROUTE_TTLS = {
+    "/api/v2/hianime/search":   float(os.getenv("SEARCH_RESPONSE_TTL", 60)),
+    "/api/v2/hianime/episodes": float(os.getenv("EPISODES_RESPONSE_TTL", 600)),
+    "/api/v2/hianime/sources":  float(os.getenv("SOURCES_RESPONSE_TTL", 120)),
+    "/api/v2/hianime/tracks":   float(os.getenv("TRACKS_RESPONSE_TTL", 120)),
+}
+
+# Most episodes one batch request may ask for
+BATCH_MAX = int(os.getenv("BATCH_MAX", 500))
+
+response_store = ResponseStore()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open the shared upstream pool on this loop, close it on shutdown
+    http_client.get_client()
+    # refuse to serve when upstream is down: the supervisor retries us
+    await preflight.run({"upstream": preflight.check_upstream(API_BASE)})
+    logging.getLogger("uvicorn.error").info("hianime-api %s", preflight.summary(_STARTED))
+    yield
+    await http_client.close_client()
 
 
-# Import your existing modules here:
-# from . import fetcher, episodes, sources, tracks
-import fetcher      # adjust the import paths if needed
-import episodes
-import sources
-import tracks
+app = FastAPI(title="Hianimez Local API", lifespan=lifespan)
 
-app = FastAPI(title="Hianimez Local API")
+# Cache + coalesce identical GETs (inside CORS so cached replies get CORS headers too)
+app.add_middleware(ResponseCacheMiddleware, store=response_store, ttls=ROUTE_TTLS)
 
 # Allow CORS from anywhere (for simplicity)
 app.add_middleware(
@@ -23,53 +63,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def _upstream(coro):
+    """Await an upstream call under REQUEST_TIMEOUT, mapping failures to 5xx."""
+    try:
+        return await asyncio.wait_for(coro, REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, "Upstream timed out")
+    except Exception as e:
+        raise HTTPException(502, str(e))
+
+
 # 1) Health endpoint
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
 
+# 1b) Cache statistics
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"responses": response_store.stats(), "upstream": cache.stats()}
+
+
 # 2) Search
 @app.get("/api/v2/hianime/search")
 async def search(q: str, page: int = 1):
-    try:
-        return fetcher.search_anime(q, page)
-    except Exception as e:
-        raise HTTPException(502, str(e))
+    return await _upstream(fetcher.search_anime_async(q, page))
 
 
 # 3) Episodes
 @app.get("/api/v2/hianime/episodes/{anime_id}")
 async def get_episodes(anime_id: str):
-    try:
-        return episodes.fetch_episodes(anime_id)
-    except Exception as e:
-        raise HTTPException(502, str(e))
+    return await _upstream(fetcher.fetch_episodes_async(anime_id))
 
 
 # 4) Sources
 @app.get("/api/v2/hianime/sources/{episode_id}")
 async def get_sources(episode_id: str):
-    try:
-        sources_list, _ = sources.fetch_sources_and_referer(episode_id)
-        return sources_list
-    except Exception as e:
-        raise HTTPException(502, str(e))
+    sources_list, _ = await _upstream(fetcher.fetch_sources_and_referer_async(episode_id))
+    return sources_list
 
 
 # 5) Tracks
 @app.get("/api/v2/hianime/tracks/{episode_id}")
 async def get_tracks(episode_id: str):
-    try:
-        return tracks.fetch_tracks(episode_id)
-    except Exception as e:
-        raise HTTPException(502, str(e))
+    return await _upstream(fetcher.fetch_tracks_async(episode_id))
+
+
+
+# 6) Batch: sources + tracks for many episodes, streamed as NDJSON
+class BatchRequest(BaseModel):
+    episodeIds: list[str]
+    server: str = "hd-1"
+    category: str = "sub"
+
+
+@app.post("/api/v2/hianime/batch/resolve")
+async def batch_resolve(req: BatchRequest):
+    if len(req.episodeIds) > BATCH_MAX:
+        raise HTTPException(413, f"At most {BATCH_MAX} episodes per batch")
+
+    async def lines():
+        async for ep, resolved, err in fetcher.resolve_many_async(
+            req.episodeIds, req.server, req.category, remote=False
+        ):
+            item = {"episodeId": ep, "error": str(err)} if err else {"episodeId": ep, **resolved}
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", 4000)),
-        reload=True
-    )
+    # only needed when started directly, not under the uvicorn CLI
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 4000)))
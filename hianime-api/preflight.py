@@ -0,0 +1,100 @@
+# preflight.py
+import os
+import time
+import shutil
+import asyncio
+import logging
+from contextlib import contextmanager
+
+import http_client
+
+# Run the startup checks at all (0 = start without them)
+STARTUP_CHECKS        = os.getenv("STARTUP_CHECKS", "1") not in ("0", "false", "no")
+# Time limit for each startup check (seconds)
+STARTUP_CHECK_TIMEOUT = float(os.getenv("STARTUP_CHECK_TIMEOUT", 5))
+
+# phase -> seconds, for the "ready in" line and /metrics
+timings = {}
+
+
+@contextmanager
+def phase(name: str):
+    """Time one startup phase into `timings`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+def summary(since: float) -> str:
+    """'ready in 0.41s (imports 0.32s, checks 0.05s, …)' measured from perf_counter() `since`."""
+    total  = time.perf_counter() - since
+    timings["total"] = total
+    phases = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items() if k != "total")
+    return f"ready in {total:.2f}s ({phases})"
+
+
+# ── checks ──────────────────────────────────────────────────────────────────
+async def check_ffmpeg(binary: str) -> str:
+    """The ffmpeg binary exists and runs; returns its version line."""
+    path = shutil.which(binary)
+    if path is None:
+        raise RuntimeError(f"ffmpeg not found: {binary!r} (set FFMPEG_BIN)")
+    proc = await asyncio.create_subprocess_exec(
+        path, "-hide_banner", "-version",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    out, _ = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{path} -version exited with {proc.returncode}")
+    return out.decode(errors="replace").partition("\n")[0]
+
+
+async def check_upstream(base: str) -> str:
+    """
+    The upstream API answers at all. Any HTTP status counts: only
+    connection failures and timeouts mean it is unreachable.
+    """
+    try:
+        resp = await http_client.get_client().get(base, timeout=STARTUP_CHECK_TIMEOUT)
+    except Exception as e:
+        raise RuntimeError(f"upstream {base} unreachable: {e!r}") from None
+    return f"{base} → HTTP {resp.status_code}"
+
+
+async def check_writable(path: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    if not os.access(path, os.W_OK):
+        raise RuntimeError(f"{path} is not writable")
+    return path
+
+
+async def run(checks: dict):
+    """
+    Run `checks` ({name: coroutine}) concurrently under
+    STARTUP_CHECK_TIMEOUT each. Logs what passed; raises RuntimeError
+    listing every failure.
+    """
+    if not STARTUP_CHECKS:
+        for coro in checks.values():
+            coro.close()
+        return
+
+    async def one(coro):
+        try:
+            return await asyncio.wait_for(coro, STARTUP_CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"no answer within {STARTUP_CHECK_TIMEOUT:g}s") from None
+
+    with phase("checks"):
+        results = await asyncio.gather(*map(one, checks.values()),
+                                       return_exceptions=True)
+    failed = []
+    for name, res in zip(checks, results):
+        if isinstance(res, BaseException):
+            failed.append(f"{name}: {res}")
+        else:
+            logging.info("Startup check %s ok: %s", name, res)
+    if failed:
+        raise RuntimeError("Startup checks failed:\n  " + "\n  ".join(failed))
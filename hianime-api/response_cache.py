@@ -0,0 +1,172 @@
+# response_cache.py
+import os
+import time
+import hashlib
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", 5000))
+RESPONSE_CACHE_BYTES   = int(os.getenv("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
+
+# headers we recompute for every cached reply
+_DROP_HEADERS = {b"content-length", b"etag", b"cache-control", b"x-cache"}
+
+
+class ResponseStore:
+    """
+    LRU of finished GET responses, bounded by entry count and total body
+    bytes, with per-entry expiry and hit/miss counters.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.bytes       = 0
+        self._data       = OrderedDict()   # key -> entry
+        self.flight      = SingleFlight()
+        self.hits = self.misses = self.coalesced = self.revalidated = self.evictions = 0
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] <= time.time():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        size = len(entry["body"])
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = entry
+        self.bytes += size
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._data.pop(key)
+        self.bytes -= len(entry["body"])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries":     len(self._data),
+            "bytes":       self.bytes,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "coalesced":   self.coalesced,
+            "revalidated": self.revalidated,
+            "evictions":   self.evictions,
+            "inflight":    self.flight.inflight(),
+            "hit_rate":    round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware caching GET responses for the configured route
+    prefixes. Identical requests that arrive while one is being computed
+    wait for it instead of hitting the upstream again. Replies carry an
+    ETag and Cache-Control max-age; a matching If-None-Match gets a 304.
+    """
+
+    def __init__(self, app, store: ResponseStore, ttls: dict):
+        self.app   = app
+        self.store = store
+        # longest prefix first so specific routes win
+        self.ttls  = sorted(ttls.items(), key=lambda kv: -len(kv[0]))
+
+    def _ttl(self, path: str):
+        for prefix, ttl in self.ttls:
+            if path.startswith(prefix):
+                return ttl
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        ttl = self._ttl(scope["path"])
+        if not ttl:
+            return await self.app(scope, receive, send)
+
+        query = "&".join(sorted(scope.get("query_string", b"").decode().split("&")))
+        key   = f"{scope['path']}?{query}"
+
+        entry = self.store.get(key)
+        if entry is not None:
+            self.store.hits += 1
+            state = "HIT"
+        else:
+            self.store.misses += 1
+            leader = False
+
+            async def compute():
+                nonlocal leader
+                leader = True
+                return await self._compute(scope, receive, key, ttl)
+
+            entry = await self.store.flight.do(key, compute)
+            if leader:
+                state = "MISS"
+            else:
+                self.store.coalesced += 1
+                state = "COALESCED"
+
+        await self._reply(scope, send, entry, state)
+
+    async def _compute(self, scope, receive, key: str, ttl: float) -> dict:
+        captured = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"]  = message["status"]
+                captured["headers"] = [
+                    (k, v) for k, v in message.get("headers", [])
+                    if k.lower() not in _DROP_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+
+        await self.app({**scope, "method": "GET"}, receive, capture)
+
+        body  = b"".join(captured["body"])
+        entry = {
+            "status":  captured["status"],
+            "headers": captured["headers"],
+            "body":    body,
+            "etag":    f'W/"{hashlib.sha1(body).hexdigest()}"'.encode(),
+            "expires": time.time() + ttl,
+        }
+        if entry["status"] == 200:
+            self.store.put(key, entry)
+        return entry
+
+    async def _reply(self, scope, send, entry: dict, state: str):
+        cacheable = entry["status"] == 200
+        headers   = list(entry["headers"]) + [(b"x-cache", state.encode())]
+        if cacheable:
+            max_age = max(0, int(entry["expires"] - time.time()))
+            headers += [
+                (b"etag", entry["etag"]),
+                (b"cache-control", f"public, max-age={max_age}".encode()),
+            ]
+
+        inm = dict(scope.get("headers", [])).get(b"if-none-match")
+        if cacheable and inm and entry["etag"] in [t.strip() for t in inm.split(b",")]:
+            self.store.revalidated += 1
+            headers = [(k, v) for k, v in headers if k != b"content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = b"" if scope["method"] == "HEAD" else entry["body"]
+        headers.append((b"content-length", str(len(entry["body"])).encode()))
+        await send({"type": "http.response.start", "status": entry["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": body})
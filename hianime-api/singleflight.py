@@ -0,0 +1,25 @@
+# singleflight.py
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key onto one in-flight task.
+    Callers that arrive while a call is running await the same result;
+    once it settles the key is released so the next call goes upstream.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        # shield: one caller giving up must not cancel the others
+        return await asyncio.shield(task)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
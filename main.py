@@ -1,22 +1,84 @@
 # main.py
+import time
+_STARTED = time.perf_counter()
+
+import os
+import sys
+import asyncio
 import logging
+
+# the bot runs on the API service's library modules (fetcher, downloader, hls, …);
+# appended so this directory's config.py stays the one imported
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "hianime-api"))
+
 from telethon import TelegramClient
-from config import ANIWATCH_API_BASE as API_BASE
+try:
+    from config import API_ID, API_HASH, API_BASE, UPLOAD_WORKERS, UPLOAD_CHANNEL
+except RuntimeError as e:
+    # missing or invalid settings: the same one-line exit as a failed check
+    sys.exit(f"❌ {e}")
 from handlers import register_handlers
+from upload_pool import upload_pool
+from storage import storage
+import ffmpeg
+import http_client
+import metrics
+import preflight
+
+preflight.timings["imports"] = time.perf_counter() - _STARTED
 
 logging.basicConfig(level=logging.INFO)
 
 client = TelegramClient('hianime_session', API_ID, API_HASH)
 
+
+def _checks() -> dict:
+    return {
+        "ffmpeg":   preflight.check_ffmpeg(ffmpeg.FFMPEG_BIN),
+        "upstream": preflight.check_upstream(API_BASE),
+        "storage":  preflight.check_writable(storage.root),
+    }
+
+
+@metrics.collector
+def _startup():
+    return [("startup_seconds", {"phase": k}, v) for k, v in preflight.timings.items()]
+
+
+metrics.describe("startup_seconds", "gauge", "Time spent in each startup phase of this process.")
+
+
 async def main():
-    # Start the session (user or bot)
-    await client.start()
+    # Log in (user or bot) while the environment is checked; either failing stops startup
+    async def login():
+        with preflight.phase("login"):
+            await client.start()
+    await asyncio.gather(login(), preflight.run(_checks()))
+    # upload workers log in next to the main session
+    with preflight.phase("workers"):
+        await upload_pool.start(API_ID, API_HASH, UPLOAD_WORKERS, UPLOAD_CHANNEL or None)
     # Wire up all your handlers
     await register_handlers(client)
-    print("🚀 Bot is up!")
+    logging.info("🚀 Bot is up, %s", preflight.summary(_STARTED))
     # Keep running until interrupted
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        await upload_pool.stop()
+
+
+async def check():
+    """`python main.py --check`: validate config and environment, then exit."""
+    try:
+        await preflight.run(_checks())
+    finally:
+        await http_client.close_client()
+    print(preflight.summary(_STARTED))
+
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    try:
+        asyncio.run(check() if "--check" in sys.argv[1:] else main())
+    except RuntimeError as e:
+        # failed config or startup checks: say why, exit non-zero for the supervisor
+        sys.exit(f"❌ {e}")
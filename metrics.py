@@ -0,0 +1,175 @@
+# metrics.py
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Local metrics endpoint (Prometheus text format); port 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+PREFIX = "hianime_"
+
+# histogram buckets (seconds): sub-second cache answers up to hour-long remuxes
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+# recent observations kept per series for the quantiles in /stats
+RECENT  = 256
+
+_help       = {}   # name -> (type, help text)
+_counters   = {}   # (name, labels) -> value
+_histograms = {}   # (name, labels) -> {"buckets", "sum", "count", "recent"}
+_collectors = []   # callables returning [(name, labels dict, value)] at scrape time
+_server     = None
+
+
+def describe(name: str, kind: str, text: str):
+    _help[name] = (kind, text)
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(labels))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    key = (name, _labels(labels))
+    h = _histograms.get(key)
+    if h is None:
+        h = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0,
+                                "count": 0, "recent": deque(maxlen=RECENT)}
+    i = bisect_left(BUCKETS, value)
+    if i < len(BUCKETS):
+        h["buckets"][i] += 1
+    h["sum"]   += value
+    h["count"] += 1
+    h["recent"].append(value)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Time the block into stage_seconds{stage=…}, failed or not."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+
+def collector(fn):
+    """Register fn() → [(name, labels, value)] to be sampled on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+# ── output ──────────────────────────────────────────────────────────────────
+def _fmt(name: str, labels, value) -> str:
+    if isinstance(labels, dict):
+        labels = _labels(labels)
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    value = int(value) if float(value).is_integer() else value
+    return f"{PREFIX}{name}{{{inner}}} {value}" if inner else f"{PREFIX}{name} {value}"
+
+
+def render() -> str:
+    """All series in the Prometheus text exposition format."""
+    series = {}
+    for (name, labels), value in _counters.items():
+        series.setdefault(name, []).append(_fmt(name, labels, value))
+    for (name, labels), h in _histograms.items():
+        lines = series.setdefault(name, [])
+        acc = 0
+        for bound, n in zip(BUCKETS, h["buckets"]):
+            acc += n
+            lines.append(_fmt(f"{name}_bucket", labels + (("le", f"{bound:g}"),), acc))
+        lines.append(_fmt(f"{name}_bucket", labels + (("le", "+Inf"),), h["count"]))
+        lines.append(_fmt(f"{name}_sum", labels, h["sum"]))
+        lines.append(_fmt(f"{name}_count", labels, h["count"]))
+    for fn in _collectors:
+        try:
+            for name, labels, value in fn():
+                series.setdefault(name, []).append(_fmt(name, labels, value))
+        except Exception:
+            logging.exception("Metrics collector %s failed", getattr(fn, "__name__", fn))
+
+    out = []
+    for name, lines in series.items():
+        if name in _help:
+            kind, text = _help[name]
+            out += [f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} {kind}"]
+        out += lines
+    return "\n".join(out) + "\n"
+
+
+def _quantile(values: list, q: float) -> float:
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+def stage_summary() -> dict:
+    """stage → {count, avg, p50, p95} over recent observations, for /stats."""
+    out = {}
+    for (name, labels), h in _histograms.items():
+        if name != "stage_seconds" or not h["count"]:
+            continue
+        recent = sorted(h["recent"])
+        out[dict(labels)["stage"]] = {
+            "count": h["count"],
+            "avg":   h["sum"] / h["count"],
+            "p50":   _quantile(recent, 0.5),
+            "p95":   _quantile(recent, 0.95),
+        }
+    return out
+
+
+def counter(name: str, **labels) -> float:
+    return _counters.get((name, _labels(labels)), 0)
+
+
+# ── HTTP endpoint ───────────────────────────────────────────────────────────
+async def _serve(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve GET /metrics on host:port; does nothing when port is 0."""
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = await asyncio.start_server(_serve, host, port)
+    logging.info("Metrics on http://%s:%d/metrics", host, port)
+    return _server
+
+
+describe("stage_seconds",     "histogram", "Wall time per pipeline stage.")
+describe("episode_seconds",   "histogram", "Wall time from start to delivery of one episode.")
+describe("episodes_total",    "counter",   "Episodes handled, by result.")
+describe("bytes_total",       "counter",   "Bytes written to disk or sent to Telegram, by kind.")
+describe("file_cache_total",  "counter",   "File-ID cache lookups, by result.")
+describe("queue_depth",       "gauge",     "Jobs waiting or running, by queue.")
+describe("ffmpeg_processes",  "gauge",     "ffmpeg processes currently running.")
+describe("cache_hits",        "counter",   "Lookups answered from cache, by cache.")
+describe("cache_misses",      "counter",   "Lookups that went upstream, by cache.")
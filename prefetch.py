@@ -0,0 +1,133 @@
+# prefetch.py
+import os
+import time
+import asyncio
+import logging
+
+import fetcher
+import downloader
+import hls
+import metrics
+from storage import storage
+
+# Episodes resolved ahead once a list is shown (0 = off)
+PREFETCH_EPISODES    = int(os.getenv("PREFETCH_EPISODES", 3))
+# Also fetch the playlist and this many first segments of each (0 = resolve only)
+PREFETCH_SEGMENTS    = int(os.getenv("PREFETCH_SEGMENTS", 0))
+# Prefetches running at once across all chats
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 4))
+# Warmed segments nobody downloaded are deleted after this long (seconds)
+PREFETCH_TTL         = float(os.getenv("PREFETCH_TTL", 600))
+
+
+class Prefetcher:
+    """
+    Speculative work for the episodes a chat is likely to tap next:
+    sources and tracks are resolved into the fetcher's sources cache
+    (which expires them with the signed URLs), and optionally the first
+    segments are fetched into the download's resume checkpoint. A chat
+    has at most one batch in flight; a new one, or leaving the list,
+    cancels it.
+    """
+
+    def __init__(self):
+        self._chats  = {}   # chat_id -> batch task
+        self._jobs   = {}   # out_path -> task warming it
+        self._warmed = {}   # out_path -> time its segments were fetched
+        self._slots  = None
+
+    def _sem(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        return self._slots
+
+    def schedule(self, chat_id: int, jobs: list):
+        """Replace chat_id's prefetch batch with the first PREFETCH_EPISODES of `jobs`."""
+        self.cancel(chat_id)
+        self.sweep()
+        jobs = jobs[:PREFETCH_EPISODES]
+        if not jobs:
+            return
+        task = asyncio.create_task(self._run(jobs))
+        self._chats[chat_id] = task
+        task.add_done_callback(
+            lambda t: self._chats.pop(chat_id, None) if self._chats.get(chat_id) is t else None
+        )
+
+    def cancel(self, chat_id: int) -> bool:
+        task = self._chats.pop(chat_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def claim(self, out_path: str):
+        """
+        A real download of out_path is starting: stop warming it and hand
+        over whatever is already on disk.
+        """
+        self._warmed.pop(out_path, None)
+        task = self._jobs.pop(out_path, None)
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def sweep(self):
+        """Delete warmed segments that went unused for PREFETCH_TTL."""
+        cutoff = time.time() - PREFETCH_TTL
+        for out_path, at in list(self._warmed.items()):
+            if at < cutoff and out_path not in self._jobs:
+                del self._warmed[out_path]
+                # only the warmed segments, never an episode being downloaded or sent
+                if out_path not in storage.entries:
+                    storage.drop_checkpoint(out_path)
+
+    async def _run(self, jobs: list):
+        tasks = []
+        for job in jobs:
+            task = asyncio.create_task(self._one(job))
+            self._jobs[job["out_mp4"]] = task
+            task.add_done_callback(
+                lambda t, k=job["out_mp4"]: self._jobs.pop(k, None) if self._jobs.get(k) is t else None
+            )
+            tasks.append(task)
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            for t in tasks:
+                t.cancel()
+            metrics.inc("prefetch_total", sum(not t.done() for t in tasks), result="cancelled")
+            raise
+
+    async def _one(self, job: dict):
+        async with self._sem():
+            try:
+                resolved = await fetcher.resolve_episode_async(
+                    job["episode_id"], job["server"], job["category"]
+                )
+                metrics.inc("prefetch_total", result="resolved")
+                # only the native engine resumes from the parts checkpoint
+                if not PREFETCH_SEGMENTS or downloader.HLS_ENGINE != "native" or not resolved["sources"]:
+                    return
+                # a real download of this file is running or queued for it
+                if storage.busy(job["out_mp4"]):
+                    return
+                src = resolved["sources"][0]
+                await hls.warm(src.get("url") or src.get("file"), resolved["referer"],
+                               job["out_mp4"], PREFETCH_SEGMENTS, job["quality"])
+                self._warmed[job["out_mp4"]] = time.time()
+                # counted in the disk budget like any other checkpoint
+                storage.keep_checkpoint(job["out_mp4"])
+                metrics.inc("prefetch_total", result="warmed")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.debug("Prefetch of %s failed", job["episode_id"], exc_info=True)
+                metrics.inc("prefetch_total", result="error")
+
+    def stats(self) -> dict:
+        return {"chats": len(self._chats), "episodes": len(self._jobs), "warmed": len(self._warmed)}
+
+
+prefetcher = Prefetcher()
+metrics.describe("prefetch_total", "counter", "Prefetched episodes, by outcome.")
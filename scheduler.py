@@ -0,0 +1,152 @@
+# scheduler.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+# Global / per-chat job concurrency and per-stage limits
+MAX_JOBS          = int(os.getenv("MAX_JOBS", 4))
+MAX_JOBS_PER_CHAT = int(os.getenv("MAX_JOBS_PER_CHAT", 2))
+MAX_DOWNLOADS     = int(os.getenv("MAX_DOWNLOADS", 3))
+MAX_UPLOADS       = int(os.getenv("MAX_UPLOADS", 2))
+
+
+class Scheduler:
+    """
+    One process-wide job runner shared by every chat.
+
+    Jobs are queued per chat and handed to a fixed pool of workers in
+    round-robin order across chats, so one large batch cannot starve a
+    single-episode request from another chat. `download_slots` and
+    `upload_slots` cap how many jobs may be in each stage at once.
+    """
+
+    def __init__(self, max_jobs=MAX_JOBS, per_chat=MAX_JOBS_PER_CHAT,
+                 max_downloads=MAX_DOWNLOADS, max_uploads=MAX_UPLOADS):
+        self.max_jobs = max_jobs
+        self.per_chat = per_chat
+        self.download_slots = asyncio.Semaphore(max_downloads)
+        self.upload_slots   = asyncio.Semaphore(max_uploads)
+        self._queues  = {}        # chat_id -> deque[(label, factory, future)]
+        self._running = {}        # chat_id -> {token: (label, started_at, task)}
+        self._rr      = deque()   # chats with queued jobs, in turn order
+        self._wake    = None
+        self._workers = []
+
+    # ── public API ──────────────────────────────────────────────────────────
+    def submit(self, chat_id: int, label: str, factory) -> asyncio.Future:
+        """
+        Queue `factory()` (a coroutine function) for chat_id.
+        Returns a future resolved with its result once it has run;
+        cancelling it cancels the job, queued or running.
+        """
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        q = self._queues.setdefault(chat_id, deque())
+        if not q and chat_id not in self._rr:
+            self._rr.append(chat_id)
+        q.append((label, factory, fut))
+        self._wake.set()
+        return fut
+
+    def set_upload_slots(self, n: int):
+        """Resize the upload stage; call before any upload has started."""
+        self.upload_slots = asyncio.Semaphore(n)
+
+    def cancel(self, chat_id: int) -> int:
+        """
+        Drop every not-yet-started job for chat_id and cancel its running
+        ones (which kills their ffmpeg). Returns how many were affected.
+        """
+        q = self._queues.pop(chat_id, deque())
+        for _, _, fut in q:
+            fut.cancel()
+        if chat_id in self._rr:
+            self._rr.remove(chat_id)
+        running = list(self._running.get(chat_id, {}).values())
+        for _, _, task in running:
+            task.cancel()
+        return len(q) + len(running)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queued":  sum(len(q) for q in self._queues.values()),
+            "running": sum(len(r) for r in self._running.values()),
+            "per_chat": {
+                chat_id: {
+                    "queued":  len(self._queues.get(chat_id, ())),
+                    "running": [
+                        (label, round(now - started, 1))
+                        for label, started, _ in self._running.get(chat_id, {}).values()
+                    ],
+                }
+                for chat_id in set(self._queues) | set(self._running)
+            },
+        }
+
+    # ── internals ───────────────────────────────────────────────────────────
+    def _ensure_started(self):
+        if self._workers:
+            return
+        self._wake = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.max_jobs)
+        ]
+
+    def _next_job(self):
+        for _ in range(len(self._rr)):
+            chat_id = self._rr[0]
+            self._rr.rotate(-1)
+            if len(self._running.get(chat_id, ())) >= self.per_chat:
+                continue
+            q = self._queues[chat_id]
+            label, factory, fut = q.popleft()
+            if not q:
+                del self._queues[chat_id]
+                self._rr.remove(chat_id)
+            return chat_id, label, factory, fut
+        return None
+
+    async def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            chat_id, label, factory, fut = job
+            if fut.cancelled():
+                continue
+            token   = object()
+            running = self._running.setdefault(chat_id, {})
+            # its own task, so cancel() can stop the job without the worker
+            task = asyncio.ensure_future(factory())
+            running[token] = (label, time.monotonic(), task)
+            # the submitter cancelling its future stops the job too
+            fut.add_done_callback(lambda f, t=task: t.cancel() if f.cancelled() else None)
+            try:
+                await asyncio.wait([task])
+                if task.cancelled():
+                    fut.cancel()
+                elif (e := task.exception()) is not None:
+                    logging.error("Scheduled job %s for chat %s failed", label, chat_id, exc_info=e)
+                    if not fut.done():
+                        fut.set_exception(e)
+                elif not fut.done():
+                    fut.set_result(task.result())
+            except asyncio.CancelledError:
+                task.cancel()
+                fut.cancel()
+                raise
+            finally:
+                running.pop(token, None)
+                if not running:
+                    self._running.pop(chat_id, None)
+                # a per-chat slot just freed up
+                self._wake.set()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,104 @@
+# search_index.py
+import os
+import asyncio
+from collections import OrderedDict
+
+import fetcher
+
+# Wait this long after a keystroke before asking upstream (seconds)
+INLINE_DEBOUNCE   = float(os.getenv("INLINE_DEBOUNCE", 0.4))
+# How long Telegram may cache an inline answer on its side (seconds)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+# Queries remembered for prefix answers
+PREFIX_CACHE_MAX  = int(os.getenv("PREFIX_CACHE_MAX", 2000))
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _matches(anime: dict, words: list) -> bool:
+    text = f"{anime.get('name', '')} {anime.get('jname', '')}".lower()
+    return all(w in text for w in words)
+
+
+class PrefixCache:
+    """
+    First-page search results by normalized query. A result list that
+    had no next page is complete, so any longer query starting with it
+    can be answered by filtering it locally instead of asking upstream.
+    """
+
+    def __init__(self, maxsize: int = PREFIX_CACHE_MAX):
+        self.maxsize = maxsize
+        self._data   = OrderedDict()   # query -> {"animes", "has_next"}
+        self.hits = self.prefix_hits = self.misses = 0
+
+    def put(self, query: str, result: dict):
+        self._data[query] = result
+        self._data.move_to_end(query)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def lookup(self, query: str) -> dict | None:
+        hit = self._data.get(query)
+        if hit is not None:
+            self._data.move_to_end(query)
+            self.hits += 1
+            return hit
+        # longest complete prefix wins
+        words = query.split()
+        for end in range(len(query) - 1, 0, -1):
+            hit = self._data.get(query[:end].rstrip())
+            if hit is not None and not hit["has_next"]:
+                self.prefix_hits += 1
+                return {"animes": [a for a in hit["animes"] if _matches(a, words)],
+                        "has_next": False}
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits,
+                "prefix_hits": self.prefix_hits, "misses": self.misses}
+
+
+class InlineSearch:
+    """
+    Search for inline queries: answered from the prefix cache when
+    possible, otherwise debounced and fetched. A newer query from the
+    same user cancels the older one while it waits or is in flight.
+    """
+
+    def __init__(self, debounce: float = INLINE_DEBOUNCE):
+        self.debounce = debounce
+        self.cache    = PrefixCache()
+        self._latest  = {}   # user_id -> task of their newest query
+
+    async def search(self, user_id: int, query: str, page: int = 1) -> dict:
+        """
+        {"animes", "has_next"} for `query`/`page`. Raises CancelledError
+        if a newer query from `user_id` supersedes this one.
+        """
+        query = normalize(query)
+        task  = asyncio.current_task()
+        prev  = self._latest.get(user_id)
+        if prev is not None and prev is not task and not prev.done():
+            prev.cancel()
+        self._latest[user_id] = task
+        try:
+            if page == 1:
+                hit = self.cache.lookup(query)
+                if hit is not None:
+                    return hit
+                # typing is still going on if another query arrives meanwhile
+                await asyncio.sleep(self.debounce)
+            result = await fetcher.search_page_async(query, page)
+            if page == 1:
+                self.cache.put(query, result)
+            return result
+        finally:
+            if self._latest.get(user_id) is task:
+                del self._latest[user_id]
+
+
+inline_search = InlineSearch()
@@ -0,0 +1,158 @@
+# state_store.py
+import os
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+
+# SQLite file holding per-chat state and download queues
+STATE_DB        = os.getenv("STATE_DB", "./state.db")
+# Chats idle for longer than this are forgotten (queues are kept until drained)
+STATE_TTL       = float(os.getenv("STATE_TTL", 7 * 24 * 3600))
+# Chats kept decoded in memory; the rest are re-read from SQLite on demand
+STATE_MAX_CHATS = int(os.getenv("STATE_MAX_CHATS", 500))
+# Search results remembered per chat (id → title)
+ANIME_META_MAX  = int(os.getenv("ANIME_META_MAX", 100))
+# How often expired chats are swept out
+STATE_SWEEP     = float(os.getenv("STATE_SWEEP", 600))
+
+
+class StateStore:
+    """
+    Per-chat state backed by SQLite, with a bounded in-memory LRU in
+    front. Values are JSON; every write goes straight to disk, so state
+    and pending download queues survive a restart.
+    """
+
+    def __init__(self, path: str = STATE_DB, ttl: float = STATE_TTL,
+                 max_chats: int = STATE_MAX_CHATS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl       = ttl
+        self.max_chats = max_chats
+        self._mem      = OrderedDict()   # chat_id -> {key: value}
+        self._taken    = {}              # chat_id -> {queue row ids being worked on}
+        self._swept    = 0.0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_state ("
+            " chat_id INTEGER, key TEXT, value TEXT, updated REAL,"
+            " PRIMARY KEY (chat_id, key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER, episode_id TEXT, job TEXT)"
+        )
+        self._db.commit()
+        self.expire()
+
+    # ── key/value ───────────────────────────────────────────────────────────
+    def _chat(self, chat_id: int) -> dict:
+        chat = self._mem.get(chat_id)
+        if chat is None:
+            rows = self._db.execute(
+                "SELECT key, value FROM chat_state WHERE chat_id = ?", (chat_id,)
+            ).fetchall()
+            chat = self._mem[chat_id] = {k: json.loads(v) for k, v in rows}
+            while len(self._mem) > self.max_chats:
+                self._mem.popitem(last=False)
+        self._mem.move_to_end(chat_id)
+        return chat
+
+    def get(self, chat_id: int, key: str, default=None):
+        return self._chat(chat_id).get(key, default)
+
+    def set(self, chat_id: int, key: str, value):
+        self._chat(chat_id)[key] = value
+        self._db.execute(
+            "INSERT OR REPLACE INTO chat_state VALUES (?, ?, ?, ?)",
+            (chat_id, key, json.dumps(value), time.time())
+        )
+        self._db.commit()
+        self._maybe_expire()
+
+    # ── search results ──────────────────────────────────────────────────────
+    def remember_anime(self, chat_id: int, animes: list):
+        """Keep id → title for the latest ANIME_META_MAX results."""
+        meta = dict(self.get(chat_id, "anime_meta", {}))
+        for a in animes:
+            meta.pop(a["id"], None)
+            meta[a["id"]] = a["name"]
+        self.set(chat_id, "anime_meta", dict(list(meta.items())[-ANIME_META_MAX:]))
+
+    def anime_name(self, chat_id: int, anime_id: str) -> str:
+        return self.get(chat_id, "anime_meta", {}).get(anime_id, anime_id)
+
+    # ── download queue ──────────────────────────────────────────────────────
+    def queue_extend(self, chat_id: int, jobs: list):
+        """Append jobs ({episode_id, anime_name, ep_num}) to the chat's queue."""
+        self._db.executemany(
+            "INSERT INTO queue (chat_id, episode_id, job) VALUES (?, ?, ?)",
+            [(chat_id, j["episode_id"], json.dumps(j)) for j in jobs]
+        )
+        self._db.commit()
+
+    def queue_take(self, chat_id: int) -> dict | None:
+        """
+        Next queued job not already being worked on. It stays on disk
+        until queue_done(), so a restart picks it up again.
+        """
+        taken = self._taken.setdefault(chat_id, set())
+        for row_id, job in self._db.execute(
+            "SELECT id, job FROM queue WHERE chat_id = ? ORDER BY id", (chat_id,)
+        ):
+            if row_id not in taken:
+                taken.add(row_id)
+                return {**json.loads(job), "queue_id": row_id}
+        return None
+
+    def queue_done(self, chat_id: int, queue_id: int):
+        self._taken.get(chat_id, set()).discard(queue_id)
+        self._db.execute("DELETE FROM queue WHERE id = ?", (queue_id,))
+        self._db.commit()
+
+    def queue_release(self, chat_id: int, queue_ids):
+        """Hand taken but unfinished jobs back, so the next drain picks them up."""
+        self._taken.get(chat_id, set()).difference_update(queue_ids)
+
+    def queue_len(self, chat_id: int | None = None) -> int:
+        """Jobs queued for chat_id, or across all chats."""
+        if chat_id is None:
+            return self._db.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+        return self._db.execute(
+            "SELECT COUNT(*) FROM queue WHERE chat_id = ?", (chat_id,)
+        ).fetchone()[0]
+
+    def queue_clear(self, chat_id: int) -> int:
+        n = self._db.execute("DELETE FROM queue WHERE chat_id = ?", (chat_id,)).rowcount
+        self._db.commit()
+        self._taken.pop(chat_id, None)
+        return n
+
+    def queued_chats(self) -> list:
+        """Chats with unfinished queues (e.g. left over from before a restart)."""
+        return [r[0] for r in self._db.execute("SELECT DISTINCT chat_id FROM queue")]
+
+    # ── expiry ──────────────────────────────────────────────────────────────
+    def expire(self) -> int:
+        """Drop state of chats idle for longer than the TTL and without a queue."""
+        cutoff = time.time() - self.ttl
+        stale  = [r[0] for r in self._db.execute(
+            "SELECT chat_id FROM chat_state GROUP BY chat_id HAVING MAX(updated) < ?"
+            " EXCEPT SELECT chat_id FROM queue", (cutoff,)
+        )]
+        for chat_id in stale:
+            self._db.execute("DELETE FROM chat_state WHERE chat_id = ?", (chat_id,))
+            self._mem.pop(chat_id, None)
+        self._db.commit()
+        self._swept = time.time()
+        return len(stale)
+
+    def _maybe_expire(self):
+        if time.time() - self._swept > STATE_SWEEP:
+            self.expire()
+
+
+store = StateStore()
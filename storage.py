@@ -0,0 +1,320 @@
+# storage.py
+import os
+import time
+import shutil
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+MB = 1024 * 1024
+
+# Where all downloads go
+DOWNLOAD_DIR        = os.getenv("DOWNLOAD_DIR", "./downloads")
+# Start evicting when the volume is fuller than this, stop below the low mark
+DISK_HIGH_WATERMARK = float(os.getenv("DISK_HIGH_WATERMARK", 0.90))
+DISK_LOW_WATERMARK  = float(os.getenv("DISK_LOW_WATERMARK", 0.80))
+# Optional cap on finished files kept under DOWNLOAD_DIR (0 = volume only)
+DOWNLOAD_DIR_MAX_MB = float(os.getenv("DOWNLOAD_DIR_MAX_MB", 0))
+# Space held for one episode while it downloads (segments + MP4 at peak)
+STORAGE_RESERVE_MB  = float(os.getenv("STORAGE_RESERVE_MB", 1024))
+# How long a download waits for space before failing (seconds)
+STORAGE_WAIT        = float(os.getenv("STORAGE_WAIT", 600))
+# Segment checkpoints of failed downloads are deleted after this long unused (seconds)
+CHECKPOINT_TTL      = float(os.getenv("CHECKPOINT_TTL", 24 * 3600))
+# Delete episode files once they are uploaded and in the file-ID cache
+DELETE_AFTER_UPLOAD = os.getenv("DELETE_AFTER_UPLOAD", "1").lower() not in ("0", "false", "no")
+
+# what counts as a finished file when scanning DOWNLOAD_DIR
+_FINISHED_EXT = (".mp4", ".mkv", ".ts", ".vtt", ".srt")
+
+
+class StorageFullError(OSError):
+    pass
+
+
+class StorageManager:
+    """
+    Keeps DOWNLOAD_DIR within its disk budget. Finished episodes (an MP4
+    plus its subtitle files, keyed by the MP4 path) are tracked with their
+    size and last use; past the high watermark the least recently used
+    ones that are not in use are deleted until usage drops below the low
+    watermark. Downloads reserve space up front and wait for it if the
+    disk is full of episodes still being uploaded.
+
+    Segment checkpoints (`<out>.parts/` + `<out>.manifest`) left by failed
+    downloads are kept so a retry resumes; they count towards the budget,
+    are evicted the same way and expire after CHECKPOINT_TTL.
+    """
+
+    def __init__(self, root: str = DOWNLOAD_DIR, high: float = DISK_HIGH_WATERMARK,
+                 low: float = DISK_LOW_WATERMARK, max_mb: float = DOWNLOAD_DIR_MAX_MB):
+        self.root      = root
+        self.high      = high
+        self.low       = min(low, high)
+        self.max_bytes = int(max_mb * MB)
+        self.entries   = {}     # key -> {"paths", "size", "used", "pins"}
+        self.checkpoints = {}   # out_path -> {"size", "used"} of a resumable download
+        self.reserved  = 0
+        self.evictions = self.evicted_bytes = 0
+        self._freed    = None
+        self._locks    = {}     # key -> [asyncio.Lock, holders + waiters]
+        os.makedirs(root, exist_ok=True)
+        self.scan()
+
+    # ── index ───────────────────────────────────────────────────────────────
+    def scan(self):
+        """Index finished files left on disk, last use taken from mtime."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # half-downloaded segment directories belong to a resumable job
+            for d in dirnames:
+                if d.endswith(".parts"):
+                    self.keep_checkpoint(os.path.join(dirpath, d[:-len(".parts")]))
+            dirnames[:] = [d for d in dirnames if not d.endswith(".parts")]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(_FINISHED_EXT) and path not in self.entries:
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    # may be cut short by a crash: evictable, never reused
+                    self.entries[path] = {"paths": [path], "size": st.st_size,
+                                          "used": st.st_mtime, "pins": 0, "scanned": True}
+
+    def _size(self, paths: list) -> int:
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    def add(self, key: str, paths: list, pinned: bool = True):
+        """
+        Register a finished episode. Subtitle files indexed on their own
+        by scan() are folded into it. Pinned entries are never evicted
+        until release().
+        """
+        paths = list(dict.fromkeys([key, *paths]))
+        # a finished download has no checkpoint left
+        self.checkpoints.pop(key, None)
+        pins  = 0
+        for p in paths:
+            old = self.entries.pop(p, None)
+            if old:
+                pins += old["pins"]
+        self.entries[key] = {"paths": paths, "size": self._size(paths),
+                             "used": time.time(), "pins": pins + int(pinned)}
+        self.enforce()
+
+    def get(self, key: str) -> list | None:
+        """Paths of an episode finished in this run, if all are still on disk."""
+        entry = self.entries.get(key)
+        if entry is None or entry.get("scanned"):
+            return None
+        if not all(os.path.exists(p) for p in entry["paths"]):
+            self.entries.pop(key)
+            return None
+        self.touch(key)
+        return entry["paths"]
+
+    def touch(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry["used"] = now = time.time()
+        for p in entry["paths"]:
+            try:
+                os.utime(p, (now, now))
+            except OSError:
+                pass
+
+    def pin(self, key: str):
+        if key in self.entries:
+            self.entries[key]["pins"] += 1
+
+    def release(self, key: str, delete: bool = False):
+        """Drop one pin; with `delete` the files go as soon as nothing else holds them."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry["pins"] = max(entry["pins"] - 1, 0)
+        if delete and not entry["pins"]:
+            self._remove(key)
+        self._notify()
+
+    def discard(self, out_path: str):
+        """
+        Clean up after a failed or cancelled download: the partial output
+        goes, its segment checkpoint stays (tracked) for a retry to
+        resume. Files of a pinned episode are never touched.
+        """
+        entry = self.entries.get(out_path)
+        if entry is not None and entry["pins"]:
+            return
+        self.entries.pop(out_path, None)
+        for p in (out_path, out_path + ".part"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        self.keep_checkpoint(out_path)
+        self._notify()
+
+    # ── checkpoints ─────────────────────────────────────────────────────────
+    def keep_checkpoint(self, out_path: str):
+        """Track the `<out>.parts/` of an unfinished download, if it has one."""
+        parts = out_path + ".parts"
+        try:
+            used = os.stat(parts).st_mtime
+            size = sum(e.stat().st_size for e in os.scandir(parts))
+        except OSError:
+            return
+        self.checkpoints[out_path] = {"size": size, "used": used}
+
+    def drop_checkpoint(self, out_path: str) -> int:
+        """
+        Delete a download's segments and manifest unless that download is
+        running or its output is pinned. Returns bytes freed.
+        """
+        entry = self.entries.get(out_path)
+        if self.busy(out_path) or (entry is not None and entry["pins"]):
+            return 0
+        info = self.checkpoints.pop(out_path, None)
+        shutil.rmtree(out_path + ".parts", ignore_errors=True)
+        try:
+            os.remove(out_path + ".manifest")
+        except FileNotFoundError:
+            pass
+        self._notify()
+        return info["size"] if info else 0
+
+    def expire_checkpoints(self) -> int:
+        """Drop checkpoints unused for CHECKPOINT_TTL; returns how many."""
+        cutoff = time.time() - CHECKPOINT_TTL
+        stale  = [k for k, c in self.checkpoints.items() if c["used"] < cutoff and not self.busy(k)]
+        for out_path in stale:
+            self.drop_checkpoint(out_path)
+        return len(stale)
+
+    def _remove(self, key: str) -> int:
+        entry = self.entries.pop(key)
+        for p in entry["paths"]:
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logging.exception("Could not delete %s", p)
+        # the per-anime directory stays: another episode may be about to
+        # download into it
+        return entry["size"]
+
+    @asynccontextmanager
+    async def lock(self, key: str):
+        """Hold `key`'s files exclusively: one download of an output at a time."""
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def busy(self, key: str) -> bool:
+        """Whether a download of `key` is running or waiting."""
+        return key in self._locks
+
+    # ── budget ──────────────────────────────────────────────────────────────
+    def _tracked(self) -> int:
+        return (sum(e["size"] for e in self.entries.values())
+                + sum(c["size"] for c in self.checkpoints.values()))
+
+    def _over(self, extra: int, mark: float) -> bool:
+        du   = shutil.disk_usage(self.root)
+        used = du.used + self.reserved + extra
+        if used > du.total * mark:
+            return True
+        limit = self.max_bytes * mark / self.high if self.max_bytes else 0
+        return bool(limit) and self._tracked() + self.reserved + extra > limit
+
+    def enforce(self, extra: int = 0) -> int:
+        """
+        If usage (plus `extra` bytes about to be written) is above the high
+        watermark, evict unpinned episodes and idle checkpoints, least
+        recently used first, until it is below the low watermark. Returns
+        the bytes freed.
+        """
+        self.expire_checkpoints()
+        if not self._over(extra, self.high):
+            return 0
+        freed = 0
+        lru = sorted([(e["used"], False, k) for k, e in self.entries.items()]
+                     + [(c["used"], True, k) for k, c in self.checkpoints.items()])
+        for _, checkpoint, key in lru:
+            if not self._over(extra, self.low):
+                break
+            if checkpoint:
+                size = self.drop_checkpoint(key)
+                freed += size
+                if size:
+                    logging.info("Evicted checkpoint of %s (%.1f MB)", key, size / MB)
+                continue
+            if key not in self.entries or self.entries[key]["pins"]:
+                continue
+            size = self._remove(key)
+            freed += size
+            self.evictions += 1
+            self.evicted_bytes += size
+            logging.info("Evicted %s (%.1f MB)", key, size / MB)
+        return freed
+
+    def _notify(self):
+        if self._freed is not None:
+            self._freed.set()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int | None = None, wait: float = STORAGE_WAIT):
+        """
+        Hold `nbytes` (default STORAGE_RESERVE_MB) for a download. Evicts
+        what it can; if pinned episodes still fill the disk, waits up to
+        `wait` seconds for uploads to release them, then raises
+        StorageFullError.
+        """
+        nbytes   = int(STORAGE_RESERVE_MB * MB) if nbytes is None else nbytes
+        deadline = time.monotonic() + wait
+        while True:
+            self.enforce(nbytes)
+            if not self._over(nbytes, self.high):
+                break
+            if self._freed is None:
+                self._freed = asyncio.Event()
+            self._freed.clear()
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise StorageFullError(f"No room for {nbytes / MB:.0f} MB under {self.root}")
+            try:
+                await asyncio.wait_for(self._freed.wait(), min(left, 30))
+            except asyncio.TimeoutError:
+                pass
+
+        self.reserved += nbytes
+        try:
+            yield
+        finally:
+            self.reserved -= nbytes
+            self._notify()
+
+    def stats(self) -> dict:
+        du = shutil.disk_usage(self.root)
+        return {
+            "episodes":      len(self.entries),
+            "checkpoints":   len(self.checkpoints),
+            "pinned":        sum(1 for e in self.entries.values() if e["pins"]),
+            "bytes":         self._tracked(),
+            "reserved":      self.reserved,
+            "disk_free":     du.free,
+            "disk_used_pct": round(du.used / du.total, 3) if du.total else 0.0,
+            "evictions":     self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+storage = StorageManager()
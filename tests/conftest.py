@@ -0,0 +1,25 @@
+# conftest.py
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the bot's modules first, then the API service's library modules, the
+# way main.py sets it up (so the bot's config.py is the one imported)
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, "hianime-api"))
+
+# module-level singletons (state store, storage, caches) are created on
+# import: keep them out of the working tree and off the network
+_work = tempfile.mkdtemp(prefix="hianime-tests-")
+os.environ.update(
+    DOWNLOAD_DIR=os.path.join(_work, "downloads"),
+    STATE_DB=os.path.join(_work, "state.db"),
+    FILE_CACHE_DB=os.path.join(_work, "file_cache.db"),
+    CACHE_DB="",
+    BATCH_API_BASE="",
+    ANIWATCH_API_BASE="http://127.0.0.1:9/api/v2/hianime",
+)
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
@@ -0,0 +1,80 @@
+# test_cache.py
+import time
+
+import cache
+from cache import MISSING, SqliteStore, TTLCache
+
+
+def test_get_returns_set_value_and_counts():
+    c = TTLCache("t", ttl=60)
+    assert c.get("a") is MISSING
+    c.set("a", {"x": 1})
+    assert c.get("a") == {"x": 1}
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c = TTLCache("t", ttl=10)
+    c.set("a", 1)
+    now[0] += 9
+    assert c.get("a") == 1
+    now[0] += 2
+    assert c.get("a") is MISSING
+    assert c.stats()["size"] == 0
+
+
+def test_zero_ttl_is_not_stored():
+    c = TTLCache("t", ttl=60)
+    c.set("a", 1, ttl=0)
+    assert c.get("a") is MISSING
+
+
+def test_lru_evicts_least_recently_used():
+    c = TTLCache("t", ttl=60, maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")          # b is now the oldest
+    c.set("c", 3)
+    assert c.get("b") is MISSING
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_non_string_keys():
+    c = TTLCache("t", ttl=60)
+    c.set(("ep", "hd-1", "sub"), [1, 2])
+    assert c.get(("ep", "hd-1", "sub")) == [1, 2]
+    c.delete(("ep", "hd-1", "sub"))
+    assert c.get(("ep", "hd-1", "sub")) is MISSING
+
+
+def test_sqlite_store_warms_a_new_cache(tmp_path):
+    db = str(tmp_path / "cache.db")
+    TTLCache("sources", ttl=60, store=SqliteStore(db)).set("a", {"url": "u"})
+    # a restart: fresh memory, same file
+    c = TTLCache("sources", ttl=60, store=SqliteStore(db))
+    assert c.get("a") == {"url": "u"}
+    assert c.stats()["size"] == 1
+
+
+def test_sqlite_store_namespaces_and_delete(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"))
+    a = TTLCache("a", ttl=60, store=store)
+    b = TTLCache("b", ttl=60, store=store)
+    a.set("k", 1)
+    assert b.get("k") is MISSING
+    a.delete("k")
+    assert TTLCache("a", ttl=60, store=store).get("k") is MISSING
+
+
+def test_sqlite_store_drops_expired_rows(tmp_path):
+    db = str(tmp_path / "cache.db")
+    store = SqliteStore(db)
+    store.set("ns", "old", 1, time.time() - 1)
+    store.set("ns", "new", 2, time.time() + 60)
+    assert store.get("ns", "old") == (MISSING, 0)
+    # expired rows are purged when the file is opened again
+    rows = SqliteStore(db)._db.execute("SELECT key FROM cache").fetchall()
+    assert rows == [("new",)]
@@ -0,0 +1,183 @@
+# test_hls.py
+import pytest
+
+import hls
+
+BASE = "https://cdn.example/stream/abc/master.m3u8"
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=5328394,RESOLUTION=1920x1080,CODECS="avc1.640028,mp4a.40.2"
+index-f1.m3u8
+#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=1173184,RESOLUTION=854x480,CODECS="avc1.64001e,mp4a.40.2"
+/other/index-f3.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=96000
+audio.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXTINF:10.010000,
+seg-1.ts
+#EXTINF:9.5,
+https://other.example/seg-2.ts
+#EXT-X-ENDLIST
+"""
+
+
+def test_is_master():
+    assert hls.is_master(MASTER)
+    assert not hls.is_master(MEDIA)
+
+
+def test_parse_attrs_keeps_quoted_commas():
+    attrs = hls.parse_attrs('#EXT-X-STREAM-INF:BANDWIDTH=10,CODECS="a,b",RESOLUTION=2x1')
+    assert attrs == {"BANDWIDTH": "10", "CODECS": "a,b", "RESOLUTION": "2x1"}
+
+
+def test_parse_master_resolves_urls_and_attributes():
+    variants = hls.parse_master(MASTER, BASE)
+    assert [v["url"] for v in variants] == [
+        "https://cdn.example/stream/abc/index-f1.m3u8",
+        "https://cdn.example/other/index-f3.m3u8",
+        "https://cdn.example/stream/abc/audio.m3u8",
+    ]
+    assert variants[0]["bandwidth"] == 5328394
+    assert variants[0]["resolution"] == (1920, 1080)
+    assert variants[0]["codecs"] == "avc1.640028,mp4a.40.2"
+    assert variants[2]["resolution"] is None
+
+
+def test_localize_plain_segments():
+    text, files, plain = hls.localize(MEDIA, BASE)
+    assert plain
+    assert files == [
+        ("seg_00000.ts", "https://cdn.example/stream/abc/seg-1.ts"),
+        ("seg_00001.ts", "https://other.example/seg-2.ts"),
+    ]
+    lines = text.splitlines()
+    assert "seg_00000.ts" in lines and "seg_00001.ts" in lines
+    assert "#EXT-X-ENDLIST" in lines
+    assert not any("example" in line for line in lines)
+
+
+def test_localize_fetches_keys_and_flags_encryption():
+    media = ('#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x1\n'
+             '#EXTINF:4,\nseg.ts\n')
+    text, files, plain = hls.localize(media, BASE)
+    assert not plain
+    assert files[0] == ("key_00000.bin", "https://cdn.example/stream/abc/key.bin")
+    assert '#EXT-X-KEY:METHOD=AES-128,URI="key_00000.bin",IV=0x1' in text.splitlines()
+
+
+def test_localize_leaves_method_none_alone():
+    media = '#EXTM3U\n#EXT-X-KEY:METHOD=NONE,URI="x"\n#EXTINF:4,\nseg.ts\n'
+    _, files, plain = hls.localize(media, BASE)
+    assert plain
+    assert [name for name, _ in files] == ["seg_00000.ts"]
+
+
+def test_playlist_duration():
+    assert hls.playlist_duration(MEDIA) == pytest.approx(19.51)
+
+
+def test_concat_keeps_playlist_order(tmp_path):
+    for name, data in (("b.ts", b"2"), ("a.ts", b"1")):
+        (tmp_path / name).write_bytes(data)
+    out = tmp_path / "out.ts"
+    hls._concat(["a.ts", "b.ts"], str(tmp_path), str(out))
+    assert out.read_bytes() == b"12"
+
+
+# ── checkpoint manifest ──────────────────────────────────────────────────────
+def _checkpoint(tmp_path, sizes: dict):
+    parts = tmp_path / "ep.mp4.parts"
+    parts.mkdir()
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/stream/index.m3u8", 3)
+    m.start()
+    for name, size in sizes.items():
+        (parts / name).write_bytes(b"x" * size)
+        m.record(name, size)
+    return parts
+
+
+def test_manifest_reload_keeps_finished_segments(tmp_path):
+    parts = _checkpoint(tmp_path, {"seg_00000.ts": 4, "seg_00001.ts": 2})
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/stream/index.m3u8", 3)
+    assert m.load(str(parts)) == {"seg_00000.ts": 4, "seg_00001.ts": 2}
+
+
+def test_manifest_drops_missing_and_truncated_segments(tmp_path):
+    parts = _checkpoint(tmp_path, {"seg_00000.ts": 4, "seg_00001.ts": 2, "seg_00002.ts": 3})
+    (parts / "seg_00001.ts").unlink()
+    (parts / "seg_00002.ts").write_bytes(b"x")     # cut short by a crash
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/stream/index.m3u8", 3)
+    assert m.load(str(parts)) == {"seg_00000.ts": 4}
+
+
+def test_manifest_of_another_stream_is_ignored(tmp_path):
+    parts = _checkpoint(tmp_path, {"seg_00000.ts": 4})
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/other/index.m3u8", 3)
+    assert m.load(str(parts)) == {}
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/stream/index.m3u8", 5)
+    assert m.load(str(parts)) == {}
+
+
+def test_manifest_ignores_a_torn_last_line(tmp_path):
+    parts = _checkpoint(tmp_path, {"seg_00000.ts": 4})
+    with open(tmp_path / "ep.mp4.manifest", "a") as f:
+        f.write("seg_00001.t")
+    m = hls.Manifest(str(tmp_path / "ep.mp4.manifest"), "/stream/index.m3u8", 3)
+    assert m.load(str(parts)) == {"seg_00000.ts": 4}
+
+
+def test_manifest_start_rewrites_survivors(tmp_path):
+    parts = _checkpoint(tmp_path, {"seg_00000.ts": 4, "seg_00001.ts": 2})
+    (parts / "seg_00001.ts").unlink()
+    path = str(tmp_path / "ep.mp4.manifest")
+    m = hls.Manifest(path, "/stream/index.m3u8", 3)
+    m.load(str(parts))
+    m.start()
+    again = hls.Manifest(path, "/stream/index.m3u8", 3)
+    assert again.load(str(parts)) == {"seg_00000.ts": 4}
+    assert len(open(path).read().splitlines()) == 2
+
+
+def test_clear_checkpoint(tmp_path):
+    _checkpoint(tmp_path, {"seg_00000.ts": 4})
+    hls.clear_checkpoint(str(tmp_path / "ep.mp4"))
+    assert list(tmp_path.iterdir()) == []
+    # nothing left to clear is fine too
+    hls.clear_checkpoint(str(tmp_path / "ep.mp4"))
+
+
+# ── variant choice ───────────────────────────────────────────────────────────
+VARIANTS = [
+    {"url": "1080", "bandwidth": 5_000_000, "resolution": (1920, 1080)},
+    {"url": "360",  "bandwidth":   600_000, "resolution": (640, 360)},
+    {"url": "720",  "bandwidth": 2_800_000, "resolution": (1280, 720)},
+    {"url": "480",  "bandwidth": 1_200_000, "resolution": (854, 480)},
+]
+
+
+@pytest.mark.parametrize("pref, url", [
+    ("best", "1080"), ("worst", "360"), ("720", "720"), ("720p", "720"),
+    ("600", "480"),   # tallest not above the target
+    ("240", "360"),   # all taller: the smallest
+])
+def test_pick_variant(pref, url):
+    assert hls.pick_variant(VARIANTS, pref)["url"] == url
+
+
+def test_pick_variant_bitrate_cap():
+    assert hls.pick_variant(VARIANTS, "best", max_bitrate=3_000_000)["url"] == "720"
+    # nothing fits: the lowest
+    assert hls.pick_variant(VARIANTS, "best", max_bitrate=1)["url"] == "360"
+
+
+def test_choose_variant_size_cap():
+    # 24 minutes in at most 300 MB ≈ 1.75 Mbit/s
+    chosen = hls.choose_variant(VARIANTS, "best", duration=1440, max_bitrate=0, max_mb=300)
+    assert chosen["url"] == "480"
+    assert hls.estimate_bytes(chosen, 1440) <= 300 * 1024 * 1024
+    # without a known duration the size cap cannot apply
+    assert hls.choose_variant(VARIANTS, "best", max_bitrate=0, max_mb=300)["url"] == "1080"
@@ -0,0 +1,141 @@
+# test_response_cache.py
+import asyncio
+
+import response_cache
+from response_cache import ResponseCacheMiddleware, ResponseStore
+
+
+class App:
+    """ASGI app counting calls; answers `body` with `status` after `delay`."""
+
+    def __init__(self, body=b'{"ok":true}', status=200, delay=0.0):
+        self.body, self.status, self.delay = body, status, delay
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(self.body)).encode())]})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+async def _get(mw, path, query=b"", method="GET", headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path,
+             "query_string": query, "headers": list(headers)}
+    await mw(scope, None, send)
+    start, body = sent
+    return start["status"], dict(start["headers"]), body["body"]
+
+
+def _middleware(app, **store):
+    return ResponseCacheMiddleware(app, ResponseStore(**store), {"/api/search": 60, "/api": 10})
+
+
+def test_second_request_is_a_hit():
+    app = App()
+    mw  = _middleware(app)
+
+    async def main():
+        return await _get(mw, "/api/search", b"q=a"), await _get(mw, "/api/search", b"q=a")
+    (s1, h1, b1), (s2, h2, b2) = asyncio.run(main())
+    assert app.calls == 1
+    assert (h1[b"x-cache"], h2[b"x-cache"]) == (b"MISS", b"HIT")
+    assert s1 == s2 == 200 and b1 == b2 == app.body
+    assert h2[b"content-length"] == str(len(app.body)).encode()
+    # the longest matching prefix sets the TTL
+    assert int(h1[b"cache-control"].rpartition(b"=")[2]) > 10
+    assert mw.store.stats()["hits"] == 1
+
+
+def test_query_order_does_not_matter():
+    app = App()
+    mw  = _middleware(app)
+
+    async def main():
+        await _get(mw, "/api/search", b"q=a&page=2")
+        return await _get(mw, "/api/search", b"page=2&q=a")
+    assert asyncio.run(main())[1][b"x-cache"] == b"HIT"
+    assert app.calls == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    app = App(delay=0.05)
+    mw  = _middleware(app)
+
+    async def main():
+        return await asyncio.gather(*(_get(mw, "/api/search", b"q=a") for _ in range(5)))
+    replies = asyncio.run(main())
+    assert app.calls == 1
+    states = sorted(h[b"x-cache"] for _, h, _ in replies)
+    assert states == [b"COALESCED"] * 4 + [b"MISS"]
+    assert all(body == app.body for _, _, body in replies)
+    assert mw.store.coalesced == 4
+
+
+def test_matching_etag_gets_a_304():
+    app = App()
+    mw  = _middleware(app)
+
+    async def main():
+        _, headers, _ = await _get(mw, "/api/search", b"q=a")
+        etag = headers[b"etag"]
+        return etag, await _get(mw, "/api/search", b"q=a",
+                                headers=[(b"if-none-match", b'W/"other", ' + etag)])
+    etag, (status, headers, body) = asyncio.run(main())
+    assert status == 304 and body == b""
+    assert headers[b"etag"] == etag
+    assert b"content-type" not in headers
+    assert mw.store.revalidated == 1
+
+
+def test_stale_etag_gets_the_body():
+    mw = _middleware(App())
+
+    async def main():
+        return await _get(mw, "/api/search", b"q=a", headers=[(b"if-none-match", b'W/"old"')])
+    status, _, body = asyncio.run(main())
+    assert status == 200 and body
+
+
+def test_head_has_no_body_but_the_length():
+    app = App()
+    mw  = _middleware(app)
+    status, headers, body = asyncio.run(_get(mw, "/api/search", b"q=a", method="HEAD"))
+    assert status == 200 and body == b""
+    assert headers[b"content-length"] == str(len(app.body)).encode()
+
+
+def test_errors_and_other_routes_are_not_cached():
+    app = App(status=502)
+    mw  = _middleware(app)
+
+    async def main():
+        for _ in range(2):
+            status, headers, _ = await _get(mw, "/api/search", b"q=a")
+            assert status == 502 and b"etag" not in headers
+        await _get(mw, "/health")
+        await _get(mw, "/health")
+    asyncio.run(main())
+    assert app.calls == 4
+    assert mw.store.stats()["entries"] == 0
+
+
+def test_store_bounds_and_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    store = ResponseStore(max_entries=10, max_bytes=10)
+    for key in ("a", "b", "c"):
+        store.put(key, {"body": b"xxxx", "expires": now[0] + 5})
+    assert store.get("a") is None               # over the byte bound
+    assert store.bytes == 8 and store.evictions == 1
+    store.put("huge", {"body": b"x" * 11, "expires": now[0] + 5})
+    assert store.get("huge") is None
+    now[0] += 6
+    assert store.get("b") is None and store.bytes == 4
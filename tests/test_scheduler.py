@@ -0,0 +1,104 @@
+# test_scheduler.py
+import asyncio
+
+import pytest
+
+from scheduler import Scheduler
+
+
+def _job(log: list, name: str, gate: asyncio.Event | None = None):
+    async def run():
+        log.append(name)
+        if gate is not None:
+            await gate.wait()
+        return name
+    return run
+
+
+def test_round_robin_across_chats():
+    async def main():
+        s, log = Scheduler(max_jobs=1, per_chat=1), []
+        futs = [s.submit(1, f"a{i}", _job(log, f"a{i}")) for i in range(3)]
+        futs.append(s.submit(2, "b0", _job(log, "b0")))
+        assert await asyncio.gather(*futs) == ["a0", "a1", "a2", "b0"]
+        return log
+    # chat 2's single job goes before chat 1's backlog
+    assert asyncio.run(main()) == ["a0", "b0", "a1", "a2"]
+
+
+def test_per_chat_limit_leaves_room_for_other_chats():
+    async def main():
+        s, log, gate = Scheduler(max_jobs=3, per_chat=2), [], asyncio.Event()
+        futs = [s.submit(1, f"a{i}", _job(log, f"a{i}", gate)) for i in range(3)]
+        futs.append(s.submit(2, "b0", _job(log, "b0", gate)))
+        await asyncio.sleep(0.01)
+        running = sorted(log)
+        stats   = s.stats()
+        gate.set()
+        await asyncio.gather(*futs)
+        return running, stats
+    running, stats = asyncio.run(main())
+    assert running == ["a0", "a1", "b0"]
+    assert stats["queued"] == 1 and stats["running"] == 3
+
+
+def test_failed_job_sets_the_exception():
+    async def main():
+        s = Scheduler(max_jobs=1)
+
+        async def boom():
+            raise ValueError("no sources")
+        with pytest.raises(ValueError):
+            await s.submit(1, "x", boom)
+        # the worker survives it
+        return await s.submit(1, "y", _job([], "y"))
+    assert asyncio.run(main()) == "y"
+
+
+def test_cancel_drops_queued_and_stops_running_jobs():
+    async def main():
+        s, log, gate = Scheduler(max_jobs=1, per_chat=1), [], asyncio.Event()
+        running = s.submit(1, "a0", _job(log, "a0", gate))
+        queued  = s.submit(1, "a1", _job(log, "a1"))
+        other   = s.submit(2, "b0", _job(log, "b0"))
+        await asyncio.sleep(0.01)
+        assert s.cancel(1) == 2
+        assert await other == "b0"
+        await asyncio.sleep(0.01)
+        return running, queued, log, s.stats()
+    running, queued, log, stats = asyncio.run(main())
+    assert running.cancelled() and queued.cancelled()
+    assert log == ["a0", "b0"]
+    assert stats == {"queued": 0, "running": 0, "per_chat": {}}
+
+
+def test_cancelling_the_future_cancels_the_job():
+    async def main():
+        s, stopped = Scheduler(max_jobs=1), asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+        fut = s.submit(1, "slow", slow)
+        await asyncio.sleep(0.01)
+        fut.cancel()
+        await asyncio.wait_for(stopped.wait(), 1)
+        # the slot is free again
+        return await asyncio.wait_for(s.submit(1, "next", _job([], "next")), 1)
+    assert asyncio.run(main()) == "next"
+
+
+def test_cancelled_future_is_skipped_before_it_starts():
+    async def main():
+        s, log, gate = Scheduler(max_jobs=1, per_chat=1), [], asyncio.Event()
+        first = s.submit(1, "a0", _job(log, "a0", gate))
+        later = s.submit(1, "a1", _job(log, "a1"))
+        later.cancel()
+        gate.set()
+        await first
+        await asyncio.sleep(0.01)
+        return log
+    assert asyncio.run(main()) == ["a0"]
@@ -0,0 +1,107 @@
+# test_search_index.py
+import asyncio
+
+import pytest
+
+import search_index
+from search_index import InlineSearch, PrefixCache, normalize
+
+NARUTO = {"id": "naruto-677", "name": "Naruto", "jname": "Naruto"}
+SHIPPU = {"id": "naruto-shippuden-355", "name": "Naruto: Shippuden", "jname": "Naruto: Shippuuden"}
+BORUTO = {"id": "boruto-8143", "name": "Boruto: Naruto Next Generations", "jname": "Boruto"}
+
+
+def test_normalize():
+    assert normalize("  Naruto   SHIPPUDEN ") == "naruto shippuden"
+
+
+def test_exact_hit():
+    c = PrefixCache()
+    c.put("naruto", {"animes": [NARUTO], "has_next": True})
+    assert c.lookup("naruto")["animes"] == [NARUTO]
+    assert c.hits == 1
+
+
+def test_complete_prefix_is_filtered_locally():
+    c = PrefixCache()
+    c.put("naru", {"animes": [NARUTO, SHIPPU, BORUTO], "has_next": False})
+    hit = c.lookup("naruto shipp")
+    assert hit == {"animes": [SHIPPU], "has_next": False}
+    # every word has to match, on either title
+    assert c.lookup("naruto next")["animes"] == [BORUTO]
+    assert c.lookup("naru shippuuden")["animes"] == [SHIPPU]
+    assert c.lookup("naru zzz")["animes"] == []
+    assert c.prefix_hits == 4 and c.misses == 0
+
+
+def test_incomplete_prefix_is_not_used():
+    c = PrefixCache()
+    c.put("naru", {"animes": [NARUTO], "has_next": True})
+    assert c.lookup("naruto") is None
+    assert c.misses == 1
+
+
+def test_longest_prefix_wins():
+    c = PrefixCache()
+    c.put("n", {"animes": [NARUTO, SHIPPU, BORUTO], "has_next": False})
+    c.put("naruto s", {"animes": [SHIPPU], "has_next": False})
+    assert c.lookup("naruto sh")["animes"] == [SHIPPU]
+
+
+def test_bounded_lru():
+    c = PrefixCache(maxsize=2)
+    for q in ("a", "b"):
+        c.put(q, {"animes": [], "has_next": True})
+    c.lookup("a")
+    c.put("c", {"animes": [], "has_next": True})
+    assert c.stats()["entries"] == 2
+    assert c.lookup("b") is None and c.lookup("a") is not None
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    async def search_page_async(query, page=1):
+        calls.append((query, page))
+        await asyncio.sleep(0.01)
+        return {"animes": [NARUTO, SHIPPU], "has_next": False}
+    monkeypatch.setattr(search_index.fetcher, "search_page_async", search_page_async)
+    return calls
+
+
+def test_newer_query_cancels_the_older_one(upstream):
+    s = InlineSearch(debounce=0.05)
+
+    async def main():
+        first = asyncio.create_task(s.search(1, "na"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(s.search(1, "nar"))
+        other = asyncio.create_task(s.search(2, "na"))
+        return await asyncio.gather(first, second, other, return_exceptions=True)
+    first, second, other = asyncio.run(main())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second["animes"] == [NARUTO, SHIPPU] and other["animes"] == [NARUTO, SHIPPU]
+    assert sorted(upstream) == [("na", 1), ("nar", 1)]
+    assert s._latest == {}
+
+
+def test_prefix_hit_skips_the_upstream(upstream):
+    s = InlineSearch(debounce=0)
+
+    async def main():
+        await s.search(1, "naru")
+        return await s.search(1, "Naruto  Ship")
+    assert asyncio.run(main())["animes"] == [SHIPPU]
+    assert upstream == [("naru", 1)]
+
+
+def test_later_pages_are_not_cached(upstream):
+    s = InlineSearch(debounce=0)
+
+    async def main():
+        await s.search(1, "naru", page=2)
+        await s.search(1, "naru", page=2)
+    asyncio.run(main())
+    assert upstream == [("naru", 2), ("naru", 2)]
+    assert s.cache.stats()["entries"] == 0
@@ -0,0 +1,91 @@
+# test_state_store.py
+import time
+
+import state_store
+from state_store import StateStore
+
+
+def _jobs(*eps):
+    return [{"episode_id": ep, "anime_name": "A", "ep_num": i} for i, ep in enumerate(eps, 1)]
+
+
+def test_values_survive_a_restart(tmp_path):
+    db = str(tmp_path / "state.db")
+    StateStore(db).set(1, "quality", "720")
+    assert StateStore(db).get(1, "quality") == "720"
+    assert StateStore(db).get(2, "quality", "best") == "best"
+
+
+def test_memory_is_bounded_but_nothing_is_lost(tmp_path):
+    s = StateStore(str(tmp_path / "state.db"), max_chats=2)
+    for chat in (1, 2, 3):
+        s.set(chat, "k", chat)
+    assert list(s._mem) == [2, 3]
+    assert s.get(1, "k") == 1
+
+
+def test_remember_anime_keeps_the_latest(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "ANIME_META_MAX", 2)
+    s = StateStore(str(tmp_path / "state.db"))
+    s.remember_anime(1, [{"id": "a", "name": "A"}, {"id": "b", "name": "B"}])
+    s.remember_anime(1, [{"id": "a", "name": "A"}, {"id": "c", "name": "C"}])
+    assert s.get(1, "anime_meta") == {"a": "A", "c": "C"}
+    assert s.anime_name(1, "c") == "C"
+    assert s.anime_name(1, "b") == "b"
+
+
+def test_queue_take_hands_out_each_job_once(tmp_path):
+    s = StateStore(str(tmp_path / "state.db"))
+    s.queue_extend(1, _jobs("e1", "e2"))
+    s.queue_extend(2, _jobs("x1"))
+    first, second = s.queue_take(1), s.queue_take(1)
+    assert [first["episode_id"], second["episode_id"]] == ["e1", "e2"]
+    assert s.queue_take(1) is None
+    # taken jobs stay queued until they are done
+    assert s.queue_len(1) == 2 and s.queue_len() == 3
+    s.queue_done(1, first["queue_id"])
+    assert s.queue_len(1) == 1
+    assert sorted(s.queued_chats()) == [1, 2]
+
+
+def test_released_jobs_are_taken_again(tmp_path):
+    s = StateStore(str(tmp_path / "state.db"))
+    s.queue_extend(1, _jobs("e1", "e2"))
+    a, b = s.queue_take(1), s.queue_take(1)
+    s.queue_done(1, a["queue_id"])
+    s.queue_release(1, {b["queue_id"]})
+    again = s.queue_take(1)
+    assert again["episode_id"] == "e2" and again["queue_id"] == b["queue_id"]
+
+
+def test_unfinished_queue_is_recovered_after_a_restart(tmp_path):
+    db = str(tmp_path / "state.db")
+    s = StateStore(db)
+    s.queue_extend(1, _jobs("e1", "e2", "e3"))
+    done = s.queue_take(1)
+    s.queue_take(1)                 # in flight when the process died
+    s.queue_done(1, done["queue_id"])
+
+    s = StateStore(db)
+    assert s.queued_chats() == [1]
+    assert [s.queue_take(1)["episode_id"] for _ in range(2)] == ["e2", "e3"]
+
+
+def test_queue_clear(tmp_path):
+    s = StateStore(str(tmp_path / "state.db"))
+    s.queue_extend(1, _jobs("e1", "e2"))
+    s.queue_take(1)
+    assert s.queue_clear(1) == 2
+    assert s.queue_len(1) == 0 and s.queue_take(1) is None
+
+
+def test_expire_forgets_idle_chats_without_a_queue(tmp_path, monkeypatch):
+    s = StateStore(str(tmp_path / "state.db"), ttl=60)
+    s.set(1, "k", "idle")
+    s.set(2, "k", "queued")
+    s.queue_extend(2, _jobs("e1"))
+    later = time.time() + 120
+    monkeypatch.setattr(state_store.time, "time", lambda: later)
+    assert s.expire() == 1
+    assert s.get(1, "k") is None
+    assert s.get(2, "k") == "queued"
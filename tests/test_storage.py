@@ -0,0 +1,185 @@
+# test_storage.py
+import os
+import time
+import asyncio
+from collections import namedtuple
+
+import pytest
+
+import storage as storage_mod
+from storage import StorageManager, StorageFullError
+
+KB = 1024
+_usage = namedtuple("usage", "total used free")
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """A manager held to a 10 KB budget on an otherwise empty volume."""
+    monkeypatch.setattr(storage_mod.shutil, "disk_usage", lambda path: _usage(1 << 50, 0, 1 << 50))
+    return StorageManager(str(tmp_path / "dl"), max_mb=10 * KB / storage_mod.MB)
+
+
+def _episode(m, name, size=4 * KB, subs=()):
+    d = os.path.join(m.root, "Anime")
+    os.makedirs(d, exist_ok=True)
+    paths = [os.path.join(d, name)] + [os.path.join(d, s) for s in subs]
+    for p in paths:
+        with open(p, "wb") as f:
+            f.write(b"x" * size)
+    return paths
+
+
+def _checkpoint(m, name, size=4 * KB):
+    out = os.path.join(m.root, "Anime", name)
+    os.makedirs(out + ".parts", exist_ok=True)
+    with open(os.path.join(out + ".parts", "seg_00000.ts"), "wb") as f:
+        f.write(b"x" * size)
+    with open(out + ".manifest", "w") as f:
+        f.write("{}\n")
+    return out
+
+
+def test_add_folds_subtitles_into_the_episode(manager):
+    paths = _episode(manager, "ep1.mp4", subs=["ep1_English.vtt"])
+    manager.add(paths[0], paths[1:])
+    assert manager.get(paths[0]) == paths
+    assert manager.stats()["bytes"] == 8 * KB
+    os.remove(paths[1])
+    assert manager.get(paths[0]) is None
+
+
+def test_least_recently_used_unpinned_episode_is_evicted(manager):
+    a, b = _episode(manager, "a.mp4")[0], _episode(manager, "b.mp4")[0]
+    manager.add(a, [], pinned=False)
+    manager.add(b, [], pinned=False)
+    manager.entries[a]["used"] -= 10
+    c = _episode(manager, "c.mp4")[0]
+    manager.add(c, [])
+    assert not os.path.exists(a) and os.path.exists(b) and os.path.exists(c)
+    assert manager.evictions == 1
+    # the per-anime directory stays for the next download
+    assert os.path.isdir(os.path.dirname(a))
+
+
+def test_pinned_episodes_are_kept_until_released(manager):
+    a, b = _episode(manager, "a.mp4")[0], _episode(manager, "b.mp4")[0]
+    manager.add(a, [])
+    manager.add(b, [])
+    c = _episode(manager, "c.mp4")[0]
+    manager.add(c, [])
+    assert all(os.path.exists(p) for p in (a, b, c))
+    manager.release(a, delete=True)
+    assert not os.path.exists(a) and a not in manager.entries
+
+
+def test_reserve_waits_for_an_upload_to_release_space(manager):
+    a = _episode(manager, "a.mp4", size=8 * KB)[0]
+    manager.add(a, [])
+
+    async def main():
+        async def upload_done():
+            await asyncio.sleep(0.05)
+            manager.release(a)
+        asyncio.create_task(upload_done())
+        async with manager.reserve(4 * KB, wait=5):
+            return manager.reserved
+    assert asyncio.run(main()) == 4 * KB
+    assert manager.reserved == 0
+    assert not os.path.exists(a)
+
+
+def test_reserve_gives_up_when_nothing_is_released(manager):
+    manager.add(_episode(manager, "a.mp4", size=8 * KB)[0], [])
+
+    async def main():
+        async with manager.reserve(4 * KB, wait=0.05):
+            pass
+    with pytest.raises(StorageFullError):
+        asyncio.run(main())
+
+
+def test_discard_keeps_the_checkpoint_for_a_retry(manager):
+    out = _checkpoint(manager, "ep1.mp4")
+    with open(out + ".part", "wb") as f:
+        f.write(b"partial")
+    manager.discard(out)
+    assert not os.path.exists(out + ".part")
+    assert os.path.isdir(out + ".parts")
+    assert manager.checkpoints[out]["size"] == 4 * KB
+    # finishing the download forgets it
+    _episode(manager, "ep1.mp4")
+    manager.add(out, [])
+    assert out not in manager.checkpoints
+
+
+def test_discard_never_touches_a_pinned_episode(manager):
+    a = _episode(manager, "a.mp4")[0]
+    manager.add(a, [])
+    manager.discard(a)
+    assert os.path.exists(a) and a in manager.entries
+
+
+def test_checkpoints_count_and_are_evicted(manager):
+    old = _checkpoint(manager, "old.mp4")
+    manager.keep_checkpoint(old)
+    manager.checkpoints[old]["used"] -= 10
+    a = _episode(manager, "a.mp4")[0]
+    manager.add(a, [], pinned=False)
+    manager.add(_episode(manager, "b.mp4")[0], [])
+    assert not os.path.exists(old + ".parts") and not os.path.exists(old + ".manifest")
+    assert old not in manager.checkpoints
+    assert os.path.exists(a)
+
+
+def test_busy_checkpoint_is_not_dropped(manager):
+    out = _checkpoint(manager, "ep1.mp4")
+    manager.keep_checkpoint(out)
+
+    async def main():
+        async with manager.lock(out):
+            assert manager.busy(out)
+            return manager.drop_checkpoint(out)
+    assert asyncio.run(main()) == 0
+    assert os.path.isdir(out + ".parts")
+    assert not manager.busy(out)
+    assert manager.drop_checkpoint(out) == 4 * KB
+
+
+def test_checkpoints_expire(manager, monkeypatch):
+    out = _checkpoint(manager, "ep1.mp4")
+    manager.keep_checkpoint(out)
+    assert manager.expire_checkpoints() == 0
+    monkeypatch.setattr(storage_mod, "CHECKPOINT_TTL", 60)
+    manager.checkpoints[out]["used"] = time.time() - 61
+    assert manager.expire_checkpoints() == 1
+    assert not os.path.exists(out + ".parts")
+
+
+def test_lock_serialises_one_output(manager):
+    order = []
+
+    async def job(name):
+        async with manager.lock("ep.mp4"):
+            order.append(f"{name} in")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} out")
+
+    async def main():
+        await asyncio.gather(job("a"), job("b"))
+    asyncio.run(main())
+    assert order == ["a in", "a out", "b in", "b out"]
+    assert not manager.busy("ep.mp4")
+
+
+def test_scan_indexes_leftovers(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod.shutil, "disk_usage", lambda path: _usage(1 << 50, 0, 1 << 50))
+    m = StorageManager(str(tmp_path / "dl"))
+    a = _episode(m, "a.mp4")[0]
+    out = _checkpoint(m, "b.mp4")
+
+    again = StorageManager(m.root)
+    assert a in again.entries and out in again.checkpoints
+    # a leftover may be cut short: evictable, never handed out as finished
+    assert again.get(a) is None
+    assert not any(".parts" in k for k in again.entries)
@@ -0,0 +1,101 @@
+# test_uploader.py
+import os
+import asyncio
+
+import uploader
+from uploader import PART_SIZE
+
+
+class FakeSender:
+    def __init__(self, parts: dict):
+        self.parts = parts
+        self.disconnected = False
+
+    async def send(self, request):
+        await asyncio.sleep(0)
+        assert request.file_part not in self.parts
+        self.parts[request.file_part] = (request.file_total_parts, request.bytes)
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    async def send_file(self, chat_id, file, **kwargs):
+        self.sent.append((chat_id, file, kwargs))
+        return "message"
+
+
+def _senders(monkeypatch, fail=False):
+    parts, senders = {}, []
+
+    async def open_sender(client):
+        if fail:
+            raise ConnectionError("DC unreachable")
+        senders.append(FakeSender(parts))
+        return senders[-1]
+    monkeypatch.setattr(uploader, "_open_sender", open_sender)
+    return parts, senders
+
+
+def test_parts_cover_the_file_once(tmp_path, monkeypatch):
+    data = os.urandom(2 * PART_SIZE + 1234)
+    path = tmp_path / "ep.mp4"
+    path.write_bytes(data)
+    parts, senders = _senders(monkeypatch)
+    progress = []
+
+    async def on_progress(current, total):
+        progress.append((current, total))
+
+    uploaded = asyncio.run(uploader.upload_parallel(None, str(path), on_progress, connections=2))
+
+    assert sorted(parts) == [0, 1, 2]
+    assert {total for total, _ in parts.values()} == {3}
+    assert b"".join(parts[i][1] for i in range(3)) == data
+    assert [len(parts[i][1]) for i in range(3)] == [PART_SIZE, PART_SIZE, 1234]
+    assert (uploaded.parts, uploaded.name) == (3, "ep.mp4")
+    assert progress[-1] == (len(data), len(data))
+    assert len(senders) == 2 and all(s.disconnected for s in senders)
+
+
+def test_exact_multiple_of_the_part_size(tmp_path, monkeypatch):
+    path = tmp_path / "ep.mp4"
+    path.write_bytes(b"x" * (2 * PART_SIZE))
+    parts, _ = _senders(monkeypatch)
+    uploaded = asyncio.run(uploader.upload_parallel(None, str(path), connections=4))
+    assert uploaded.parts == 2 and sorted(parts) == [0, 1]
+
+
+def test_small_files_use_the_regular_upload(tmp_path, monkeypatch):
+    path = tmp_path / "ep.mp4"
+    path.write_bytes(b"x" * 10)
+    parts, _ = _senders(monkeypatch)
+    client = FakeClient()
+    asyncio.run(uploader.send_video(client, 1, str(path), caption="ep"))
+    assert parts == {}
+    assert client.sent[0][1] == str(path)
+
+
+def test_failed_parallel_upload_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploader, "UPLOAD_PARALLEL_MIN", 1)
+    path = tmp_path / "ep.mp4"
+    path.write_bytes(b"x" * 10)
+    _senders(monkeypatch, fail=True)
+    client = FakeClient()
+    assert asyncio.run(uploader.send_video(client, 1, str(path))) == "message"
+    assert client.sent[0][1] == str(path)
+
+
+def test_large_files_are_sent_as_one_big_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploader, "UPLOAD_PARALLEL_MIN", 1)
+    path = tmp_path / "ep.mp4"
+    path.write_bytes(b"x" * (PART_SIZE + 1))
+    parts, _ = _senders(monkeypatch)
+    client = FakeClient()
+    asyncio.run(uploader.send_video(client, 1, str(path)))
+    assert sorted(parts) == [0, 1]
+    assert isinstance(client.sent[0][1], uploader.types.InputFileBig)
@@ -0,0 +1,177 @@
+# upload_pool.py
+import os
+import re
+import time
+import asyncio
+import logging
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+import metrics
+import uploader
+from scheduler import scheduler, MAX_UPLOADS
+
+# How long a worker is skipped after an upload failed on it (seconds)
+WORKER_COOLDOWN = float(os.getenv("WORKER_COOLDOWN", 60))
+
+_BOT_TOKEN_RE = re.compile(r"^\d+:[\w-]{30,}$")
+
+
+class Worker:
+    def __init__(self, name: str, client):
+        self.name     = name
+        self.client   = client
+        self.active   = 0       # uploads in progress
+        self.inflight = 0       # bytes of those uploads
+        self.uploads  = 0
+        self.bytes    = 0
+        self.failures = 0
+        self.cooling_until = 0.0
+
+    def load(self) -> tuple:
+        return (self.inflight, self.active)
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooling_until
+
+
+class UploadPool:
+    """
+    Extra Telegram sessions that upload on behalf of the main one, so
+    upload throughput grows with the number of sessions. Each video goes
+    to the least-loaded healthy worker (bytes in flight, then uploads).
+
+    With a relay channel the worker posts into it and the main session
+    re-sends the media to the chat: a server-side copy, so the user sees
+    the main bot and the returned message carries the main session's
+    file reference for the file-ID cache. Without one the worker posts
+    into the chat directly. With no workers everything goes through the
+    main session as before.
+    """
+
+    def __init__(self):
+        self.workers = []
+        self.relay   = None
+
+    async def start(self, api_id: int, api_hash: str, specs: list, relay=None):
+        """
+        Log in one worker per spec: a bot token, or the name of a session
+        file that is already authorised. Workers that fail to log in are
+        skipped with a warning. Upload slots grow with the pool.
+        """
+        self.relay = relay
+        for i, spec in enumerate(specs):
+            is_bot = bool(_BOT_TOKEN_RE.match(spec))
+            name   = f"hianime_worker_{i}" if is_bot else spec
+            client = TelegramClient(name, api_id, api_hash)
+            try:
+                if is_bot:
+                    await client.start(bot_token=spec)
+                else:
+                    await client.connect()
+                    if not await client.is_user_authorized():
+                        raise RuntimeError(f"session {spec!r} is not logged in")
+                if relay is not None:
+                    # make the relay peer known to this session
+                    await client.get_input_entity(relay)
+            except Exception:
+                logging.exception("Upload worker %s unavailable", name)
+                await client.disconnect()
+                continue
+            self.workers.append(Worker(name, client))
+        scheduler.set_upload_slots(MAX_UPLOADS * (1 + len(self.workers)))
+        if self.workers:
+            logging.info("Upload pool: %d workers, %s delivery",
+                         len(self.workers), "relay" if relay is not None else "direct")
+
+    async def stop(self):
+        await asyncio.gather(*(w.client.disconnect() for w in self.workers),
+                             return_exceptions=True)
+        self.workers.clear()
+
+    def pick(self, exclude=()) -> Worker | None:
+        ready = [w for w in self.workers if w.healthy() and w.name not in exclude]
+        return min(ready, key=Worker.load) if ready else None
+
+    async def send_video(self, client, chat_id: int, path: str, progress=None, **kwargs):
+        """
+        uploader.send_video() through the pool. Returns the message as
+        the main session (`client`) sees it, or None if that can't be
+        known (direct delivery into a private chat), in which case it is
+        not cacheable. Falls back to `client` when no worker manages it.
+        """
+        size  = os.path.getsize(path)
+        tried = set()
+        while (worker := self.pick(tried)) is not None:
+            tried.add(worker.name)
+            if self.relay is None and not await self._reaches(worker, chat_id):
+                continue
+            worker.active   += 1
+            worker.inflight += size
+            try:
+                msg = await self._send_via(client, worker, chat_id, path, progress, **kwargs)
+                worker.uploads += 1
+                worker.bytes   += size
+                return msg
+            except asyncio.CancelledError:
+                raise
+            except FloodWaitError as e:
+                worker.failures += 1
+                worker.cooling_until = time.monotonic() + e.seconds
+                logging.warning("Worker %s flood-waited %ss, trying another", worker.name, e.seconds)
+            except Exception:
+                worker.failures += 1
+                worker.cooling_until = time.monotonic() + WORKER_COOLDOWN
+                logging.exception("Upload via worker %s failed", worker.name)
+            finally:
+                worker.active   -= 1
+                worker.inflight -= size
+
+        return await uploader.send_video(client, chat_id, path, progress, **kwargs)
+
+    async def _reaches(self, worker: Worker, chat_id: int) -> bool:
+        """
+        Whether the worker can post into chat_id at all, checked before it
+        uploads anything: a bot can't message users who never started it,
+        and a session only knows peers it has already seen.
+        """
+        try:
+            await worker.client.get_input_entity(chat_id)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.debug("Worker %s cannot reach %s", worker.name, chat_id, exc_info=True)
+            return False
+
+    async def _send_via(self, main, worker: Worker, chat_id: int, path: str, progress, **kwargs):
+        if self.relay is None:
+            sent = await uploader.send_video(worker.client, chat_id, path, progress, **kwargs)
+            # channel / supergroup message ids are shared, private chat ids are not
+            if str(chat_id).startswith("-100"):
+                return await main.get_messages(chat_id, ids=sent.id)
+            return None
+
+        posted = await uploader.send_video(worker.client, self.relay, path, progress,
+                                           caption=os.path.basename(path))
+        copy = await main.get_messages(self.relay, ids=posted.id)
+        return await main.send_file(chat_id, copy.media, **kwargs)
+
+    def stats(self) -> list:
+        return [{"name": w.name, "active": w.active, "inflight": w.inflight,
+                 "uploads": w.uploads, "bytes": w.bytes, "failures": w.failures,
+                 "healthy": w.healthy()} for w in self.workers]
+
+
+upload_pool = UploadPool()
+
+
+@metrics.collector
+def _gauges():
+    out = []
+    for w in upload_pool.stats():
+        out += [("upload_worker_inflight_bytes", {"worker": w["name"]}, w["inflight"]),
+                ("upload_worker_uploads",        {"worker": w["name"]}, w["uploads"]),
+                ("upload_worker_failures",       {"worker": w["name"]}, w["failures"])]
+    return out
@@ -0,0 +1,129 @@
+# uploader.py
+import os
+import copy
+import math
+import time
+import asyncio
+import logging
+
+from telethon import helpers
+from telethon.errors import FloodWaitError
+from telethon.network import MTProtoSender
+from telethon.tl import functions, types
+from telethon.tl.alltlobjects import LAYER
+
+# Extra MTProto connections used to push parts of one file concurrently
+UPLOAD_CONNECTIONS  = int(os.getenv("UPLOAD_CONNECTIONS", 4))
+# Files smaller than this go through Telethon's regular upload
+UPLOAD_PARALLEL_MIN = int(os.getenv("UPLOAD_PARALLEL_MIN", 20 * 1024 * 1024))
+# Minimum seconds between progress edits of the status message
+PROGRESS_INTERVAL   = float(os.getenv("PROGRESS_INTERVAL", 5))
+
+# Telegram's maximum part size
+PART_SIZE = 512 * 1024
+
+
+class Progress:
+    """
+    Throttled progress callback that edits a status message at most once
+    per PROGRESS_INTERVAL seconds. A FloodWait pushes the next edit back
+    instead of failing the upload.
+    """
+
+    def __init__(self, message, label: str, interval: float = PROGRESS_INTERVAL):
+        self.message  = message
+        self.label    = label
+        self.interval = interval
+        self.started  = time.monotonic()
+        self.next_at  = self.started + interval
+
+    async def __call__(self, current: int, total: int):
+        now = time.monotonic()
+        if self.message is None or now < self.next_at or current >= total:
+            return
+        self.next_at = now + self.interval
+        speed = current / max(now - self.started, 1e-6) / (1024 * 1024)
+        try:
+            await self.message.edit(
+                f"⬆️ Uploading {self.label}… {current * 100 // total}% ({speed:.1f} MB/s)",
+                parse_mode="markdown"
+            )
+        except FloodWaitError as e:
+            self.next_at = now + e.seconds
+        except Exception:
+            logging.debug("Progress edit failed", exc_info=True)
+
+
+async def _open_sender(client) -> MTProtoSender:
+    """Open one more connection to our home DC, reusing the session's auth key."""
+    session = client.session
+    sender  = MTProtoSender(session.auth_key, loggers=client._log)
+    await sender.connect(client._connection(
+        session.server_address,
+        session.port,
+        session.dc_id,
+        loggers=client._log,
+        proxy=client._proxy,
+    ))
+    init = copy.copy(client._init_request)
+    init.query = functions.help.GetConfigRequest()
+    await sender.send(functions.InvokeWithLayerRequest(LAYER, init))
+    return sender
+
+
+async def upload_parallel(client, path: str, progress=None, connections: int = UPLOAD_CONNECTIONS):
+    """
+    Upload `path` as a big file with parts sent concurrently over
+    `connections` MTProto senders. Each worker reads its own parts from
+    disk, so memory stays at one part per connection.
+    Returns the InputFileBig to pass to send_file.
+    """
+    size    = os.path.getsize(path)
+    total   = math.ceil(size / PART_SIZE)
+    file_id = helpers.generate_random_long()
+    parts   = iter(range(total))
+    sent    = 0
+
+    senders = await asyncio.gather(*(_open_sender(client) for _ in range(connections)))
+
+    async def worker(sender):
+        nonlocal sent
+        with open(path, "rb") as f:
+            for index in parts:
+                f.seek(index * PART_SIZE)
+                data = f.read(PART_SIZE)
+                await sender.send(functions.upload.SaveBigFilePartRequest(
+                    file_id, index, total, data
+                ))
+                sent += len(data)
+                if progress:
+                    await progress(sent, size)
+
+    try:
+        await asyncio.gather(*(worker(s) for s in senders))
+    finally:
+        await asyncio.gather(*(s.disconnect() for s in senders), return_exceptions=True)
+
+    return types.InputFileBig(file_id, total, os.path.basename(path))
+
+
+async def send_video(client, chat_id: int, path: str, progress=None, **kwargs):
+    """
+    send_file() for large videos: parallel part upload above
+    UPLOAD_PARALLEL_MIN, Telethon's sequential upload below it or if
+    the parallel path fails.
+    """
+    if os.path.getsize(path) >= UPLOAD_PARALLEL_MIN and UPLOAD_CONNECTIONS > 1:
+        try:
+            uploaded = await upload_parallel(client, path, progress)
+            return await client.send_file(
+                chat_id, uploaded, supports_streaming=True, **kwargs
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("Parallel upload failed, falling back to sequential")
+
+    return await client.send_file(
+        chat_id, path, supports_streaming=True, progress_callback=progress, **kwargs
+    )